@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+"""Mountain smoothing time against world width.
+
+Run from the project root: python -m benchmarks.smoothing
+"""
+
+from os import path
+import random
+import time
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+RESOURCE_DIR = path.join(ROOT_DIR, 'resources')
+
+from src.world.world import WorldObject
+from src.world.world_generator import ArrayWorldGenerator
+
+WIDTHS = (1000, 2000, 4000, 8000, 16000, 32000)
+HEIGHT = 300
+REPEAT = 3
+
+
+def smoothing_time(width, height):
+    best = None
+    for run in range(REPEAT):
+        random.seed(run)
+        generator = ArrayWorldGenerator(width, height)
+        generator._ground()
+        generator._mountains()
+
+        start = time.perf_counter()
+        generator._smooth_mountains()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    WorldObject.init(RESOURCE_DIR)
+    print('{:>8} {:>10} {:>12}'.format('width', 'ms', 'us/column'))
+    for width in WIDTHS:
+        elapsed = smoothing_time(width, HEIGHT)
+        print('{:>8} {:>10.2f} {:>12.3f}'.format(
+            width, elapsed * 1000, elapsed * 1e6 / width))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/python3
+
+"""Headless benchmarks of world generation, ticking and drawing.
+
+Run from the project root: python -m benchmarks.suite -o bench.json
+Every case is run once for wall time and once more under tracemalloc for
+memory, tracing slows the code down too much to time both together, see
+measure. Pass --compare with an older result file to print how each case
+changed.
+"""
+
+from os import path
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+RESOURCE_DIR = path.join(ROOT_DIR, 'resources')
+
+from src.world.world import WorldObject
+from src.world.world_generator import WorldGenerator
+from src.sdl_main import PyCraft
+from src.player import Player
+from src.entities import Entities, KINDS
+
+GENERATION_SIZES = ((1000, 300), (4000, 300), (10000, 1000))
+WORLD_SIZE = (1000, 300)
+FRAMES = 300
+ENTITIES = 10000
+# sand filling the top of a cave of CAVE_SIZE cells, and water under it
+CAVE_SIZE = (100, 60)
+SAND_ROWS = 30
+WATER_ROWS = 10
+# milliseconds of game time per frame
+DT = PyCraft.STEP_MS
+
+
+def retained(before, after):
+    """Blocks and bytes allocated between two snapshots and still alive
+    after, summed per line that allocated them so frees elsewhere do not
+    cancel them out"""
+    blocks = size = 0
+    for stat in after.compare_to(before, 'lineno'):
+        blocks += max(stat.count_diff, 0)
+        size += max(stat.size_diff, 0)
+    return blocks, size
+
+
+def measure(setup, frame, frames):
+    """Time frames calls of frame(state, index) on the state returned by
+    setup, then run them again traced for:
+
+    peak_kib, the most memory traced during any frame.
+    peak_growth_kib_per_frame, how far the memory rose above what it was
+    at the start of a frame, at its peak.
+    retained_blocks_per_frame and retained_kib_per_frame, the blocks and
+    bytes allocated in a frame that are still alive at its end.
+
+    Memory allocated and freed again within a frame only shows in the
+    peak growth, CPython keeps no count of every allocation.
+    """
+    state = setup()
+    start = time.perf_counter()
+    for index in range(frames):
+        frame(state, index)
+    wall = time.perf_counter() - start
+
+    state = setup()
+    # snapshots are traced too, leave them out of each other
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    peak = growth = blocks = size = 0
+    snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+    for index in range(frames):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        frame(state, index)
+        frame_peak = tracemalloc.get_traced_memory()[1]
+        peak = max(peak, frame_peak)
+        growth += frame_peak - before
+
+        previous, snapshot = snapshot,\
+            tracemalloc.take_snapshot().filter_traces(ignore)
+        frame_blocks, frame_size = retained(previous, snapshot)
+        blocks += frame_blocks
+        size += frame_size
+    tracemalloc.stop()
+
+    return {
+        'frames': frames,
+        'wall_s': wall,
+        'frame_ms': wall * 1000 / frames,
+        'peak_kib': peak / 1024,
+        'peak_growth_kib_per_frame': growth / 1024 / frames,
+        'retained_blocks_per_frame': blocks / frames,
+        'retained_kib_per_frame': size / 1024 / frames,
+    }
+
+
+def generation(width, height):
+    return measure(
+        lambda: None,
+        lambda state, index: WorldGenerator.generate_world(
+            None, (width, height), vectorized=True, seed=index),
+        3)
+
+
+def world_tick(game, frames):
+    """Dig into the surface every frame and tick"""
+    def setup():
+        world = WorldGenerator.generate_world(
+            None, WORLD_SIZE, vectorized=True, seed=0)
+        world.settle()
+        return world
+
+    def frame(world, index):
+        x = index * 7 % world.width
+        world.dig(x, world.surface_height(x))
+        world.tick(DT)
+
+    return measure(setup, frame, frames)
+
+
+def sand_collapse(game, frames):
+    """Tick while CAVE_SIZE[0] * SAND_ROWS cells of sand fall to the bottom
+    of a cave, through the water under them, over and over"""
+    width, height = CAVE_SIZE
+    low = WORLD_SIZE[0] // 2 - width // 2
+    top = WORLD_SIZE[1] - height - 10
+
+    def collapse(world):
+        for x in range(low - 1, low + width + 1):
+            world.fill(x, top, top + height + 1, 'rock')
+        for x in range(low, low + width):
+            world.fill(x, top, top + SAND_ROWS, 'sand')
+            world.fill(x, top + SAND_ROWS, top + SAND_ROWS + WATER_ROWS,
+                       'water')
+            world.fill(x, top + SAND_ROWS + WATER_ROWS, top + height, 'air')
+            world.automaton.wake(x, top + SAND_ROWS + WATER_ROWS - 1)
+
+    def setup():
+        world = WorldGenerator.generate_world(
+            None, WORLD_SIZE, vectorized=True, seed=0)
+        world.settle()
+        collapse(world)
+        return world
+
+    def frame(world, index):
+        if world.automaton.settled:
+            collapse(world)
+        world.tick(DT)
+
+    return measure(setup, frame, frames)
+
+
+def relight(game, frames):
+    """Dig a cell out of the surface and build it back every frame, every
+    other time as a glowing block, with the light of the whole world
+    computed"""
+    def setup():
+        world = WorldGenerator.generate_world(
+            None, WORLD_SIZE, vectorized=True, seed=0)
+        world.settle()
+        for x in range(0, world.width, world.lighting.chunk_size):
+            for y in range(0, world.height, world.lighting.chunk_size):
+                world.lighting.level(x, y)
+        return world
+
+    def frame(world, index):
+        x = index // 2 * 7 % world.width
+        top = world.surface_height(x)
+        if index % 2:
+            world.build(x, top - 1, 'glowstone' if index % 4 == 1 else
+                        'ground')
+        else:
+            while world.surface_height(x) == top:
+                world.dig(x, top)
+        world.take_dirty()
+
+    return measure(setup, frame, frames)
+
+
+def player_tick(game, frames):
+    """Walk back and forth, jumping now and then"""
+    def setup():
+        random.seed(0)
+        player = game.player
+        player.position.pos = [
+            game.world.width // 2,
+            max(game.world.surface_height(game.world.width // 2) -
+                player.size.y, 0)
+        ]
+        return player
+
+    def frame(player, index):
+        if index % 40 == 0:
+            player.move(1 if index // 40 % 2 else -1)
+        if index % 25 == 0:
+            player.jump()
+        player.tick(Player.STEP)
+
+    return measure(setup, frame, frames)
+
+
+def entities_step(game, frames):
+    """Step ENTITIES entities of every kind thrown around the world, a
+    third of them pushed again every half second"""
+    def setup():
+        random.seed(0)
+        world = game.world
+        entities = Entities(world)
+        for index in range(ENTITIES):
+            x = random.uniform(1, world.width - 3)
+            top = min(world.surface_height(column)
+                      for column in range(int(x) - 1, int(x) + 3))
+            entities.spawn(random.choice(KINDS).name, x, top - 10,
+                           random.uniform(-8, 8), random.uniform(-10, 0))
+        return entities
+
+    def frame(entities, index):
+        if index % 30 == 0:
+            for entity in range(index // 30 % 3, len(entities), 3):
+                entities.push(entity, random.uniform(-4, 4), -5)
+        entities.step(DT)
+
+    return measure(setup, frame, frames)
+
+
+def update_screen(game, frames, scroll):
+    """Redraw the whole view, or move it a column every frame if scroll"""
+    def setup():
+        game.offset.pos = [0, max(game.world.surface_height(0) -
+                                  game.blocks_in_height // 2, 0)]
+        game.dirty = True
+        game.draw()
+        return game
+
+    def frame(game, index):
+        if scroll:
+            game.offset.x = index % (game.world.width - game.blocks_in_width)
+        else:
+            game.dirty = True
+        game.draw()
+
+    return measure(setup, frame, frames)
+
+
+def game_frame(game, frames):
+    """Whole frames of the engine, walking right"""
+    def setup():
+        game.player.move(1)
+        game.dirty = True
+        return game
+
+    def frame(game, index):
+        if index % 40 == 0:
+            game.player.move(1)
+        game.step(DT)
+        game.render()
+
+    return measure(setup, frame, frames)
+
+
+def idle_frame(game, frames):
+    """Whole frames of the engine with the player standing still"""
+    def setup():
+        game.player.velocity.x = 0
+        for index in range(30):
+            game.step(DT)
+            game.render()
+        return game
+
+    def frame(game, index):
+        game.step(DT)
+        game.render()
+
+    return measure(setup, frame, frames)
+
+
+def run(frames, only=None):
+    cases = {}
+
+    def case(name, benchmark, *args):
+        if only and not any(part in name for part in only):
+            return
+        print(name, file=sys.stderr)
+        cases[name] = benchmark(*args)
+
+    for width, height in GENERATION_SIZES:
+        case('generate_world_{}x{}'.format(width, height),
+             generation, width, height)
+
+    game = PyCraft(RESOURCE_DIR, headless=True,
+                   world=WorldGenerator.generate_world(
+                       None, WORLD_SIZE, vectorized=True, seed=0))
+    case('world_tick', world_tick, game, frames)
+    case('sand_collapse', sand_collapse, game, frames)
+    case('relight', relight, game, frames)
+    case('player_tick', player_tick, game, frames)
+    case('entities_step', entities_step, game, frames)
+    case('update_screen_full', update_screen, game, frames, False)
+    case('update_screen_scrolled', update_screen, game, frames, True)
+    case('game_frame', game_frame, game, frames)
+    case('idle_frame', idle_frame, game, frames)
+    return cases
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    print('{:<32} {:>10} {:>10} {:>8}'.format('case', 'old ms', 'new ms',
+                                              'ratio'))
+    for name, result in new['cases'].items():
+        if name not in old['cases']:
+            continue
+        before = old['cases'][name]['frame_ms']
+        after = result['frame_ms']
+        print('{:<32} {:>10.3f} {:>10.3f} {:>8.2f}'.format(
+            name, before, after, after / before if before else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--only', nargs='*',
+                        help='run only cases with any of these in the name')
+    parser.add_argument('--compare', help='earlier JSON result to compare')
+    args = parser.parse_args()
+
+    WorldObject.init(RESOURCE_DIR)
+    results = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cases': run(args.frames, args.only),
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as old:
+            compare(json.load(old), results)
+
+
+if __name__ == '__main__':
+    main()
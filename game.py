@@ -1,9 +1,30 @@
 #!/usr/bin/python3
 
 from os import path
+import argparse
 
 ROOT_DIR = path.dirname(path.abspath(__file__))
 RESOURCE_DIR = path.join(ROOT_DIR, 'resources')
 
 from src.sdl_main import PyCraft
-game = PyCraft(RESOURCE_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Py-craft')
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help='write the times and counts of the last frames to FILE '
+             'on quit, CSV if it ends in .csv, JSON otherwise')
+    parser.add_argument('--debug', action='store_true',
+                        help='start with the profile overlay shown')
+    args = parser.parse_args()
+
+    PyCraft.DEBUG = args.debug
+    game = PyCraft(RESOURCE_DIR, path.join(ROOT_DIR, 'world.save'))
+    game.run()
+    if args.profile:
+        game.profiler.dump(args.profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import sdl2
+
+
+def intersect(a, b):
+    """Intersection of two SDL_Rects, None if they do not overlap"""
+    x, y = max(a.x, b.x), max(a.y, b.y)
+    w = min(a.x + a.w, b.x + b.w) - x
+    h = min(a.y + a.h, b.y + b.h) - y
+    if w <= 0 or h <= 0:
+        return None
+    return sdl2.rect.SDL_Rect(x, y, w, h)
+
+
+class Layer:
+
+    """Surface put on screen with its top left corner at (x, y), showing
+    only the part of it within the screen rect bounds"""
+
+    def __init__(self, surface, x=0, y=0, bounds=None):
+        self.surface = surface
+        self.x, self.y = x, y
+        self.bounds = bounds or sdl2.rect.SDL_Rect(0, 0, 0, 0)
+
+    def blit(self, area, target):
+        """Put the part of the layer inside the screen rect area on target"""
+        part = intersect(area, self.bounds)
+        if part is None:
+            return
+        sdl2.surface.SDL_BlitSurface(
+            self.surface,
+            sdl2.rect.SDL_Rect(part.x - self.x, part.y - self.y,
+                               part.w, part.h),
+            target, sdl2.rect.SDL_Rect(part.x, part.y, 0, 0))
+
+
+class SpriteLayer:
+
+    """Layer of any number of small surfaces, each put on screen at its own
+    rect. sprites are (surface, screen SDL_Rect) pairs, surfaces larger than
+    their rect are cut to it."""
+
+    def __init__(self):
+        self.sprites = []
+
+    def blit(self, area, target):
+        for surface, bounds in self.sprites:
+            part = intersect(area, bounds)
+            if part is None:
+                continue
+            sdl2.surface.SDL_BlitSurface(
+                surface,
+                sdl2.rect.SDL_Rect(part.x - bounds.x, part.y - bounds.y,
+                                   part.w, part.h),
+                target, sdl2.rect.SDL_Rect(part.x, part.y, 0, 0))
+
+
+class Compositor:
+
+    """Puts layers on the target surface bottom to top, only where the
+    screen was damaged since the last composite"""
+
+    def __init__(self, target, width, height):
+        self.target = target
+        self.screen = sdl2.rect.SDL_Rect(0, 0, width, height)
+        self.layers = []
+        self.damaged = []
+
+    def add(self, layer):
+        self.layers.append(layer)
+        return layer
+
+    def damage(self, rect=None):
+        """Mark a screen rect, by default the whole screen, to be put
+        together again"""
+        rect = intersect(rect or self.screen, self.screen)
+        if rect is None:
+            return
+        if (rect.w, rect.h) == (self.screen.w, self.screen.h):
+            self.damaged = [rect]
+        elif not self.damaged or self.damaged[0].w != self.screen.w or\
+                self.damaged[0].h != self.screen.h:
+            self.damaged.append(rect)
+
+    def move(self, layer, x, y, bounds):
+        """Move a layer, damaging where it was and where it is now"""
+        self.damage(layer.bounds)
+        layer.x, layer.y, layer.bounds = x, y, bounds
+        self.damage(bounds)
+
+    def composite(self):
+        """Put the damaged rects together, returns them"""
+        damaged, self.damaged = self.damaged, []
+        for area in damaged:
+            for layer in self.layers:
+                layer.blit(area, self.target)
+        return damaged
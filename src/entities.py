@@ -0,0 +1,271 @@
+from array import array
+from collections import namedtuple
+from math import ceil, floor
+
+EntityKind = namedtuple('EntityKind', 'id name width height gravity')
+
+# sizes in cells, gravity as a part of Entities.gravity
+KINDS = (
+    EntityKind(0, 'mob', 1.0, 2.0, 1.0),
+    EntityKind(1, 'item', 0.5, 0.5, 1.0),
+    EntityKind(2, 'projectile', 0.25, 0.25, 0.25),
+)
+KIND_IDS = {kind.name: kind.id for kind in KINDS}
+# by kind id, for the hot loops
+WIDTHS = [kind.width for kind in KINDS]
+HEIGHTS = [kind.height for kind in KINDS]
+GRAVITIES = [kind.gravity for kind in KINDS]
+MAX_WIDTH = max(WIDTHS)
+MAX_HEIGHT = max(HEIGHTS)
+
+
+class Entities:
+
+    """Things moving around the world other than the player, mobs, dropped
+    items and projectiles, stored as a structure of arrays: entity i is at
+    (x[i], y[i]) in cells, moves at (vx[i], vy[i]) cells per second and has
+    the kind kind[i] and some kind specific data[i], like the block type of
+    an item. Removing an entity moves the last one in its place.
+
+    step moves all of them a field at a time in passes over the arrays and
+    collides them with the solid cells of the world using its column
+    bitmaps, only for the entities whose edge crossed into new cells.
+    Entities that came to rest on the ground sleep and are skipped until
+    a cell in a column they are over changes solidity. Entities are kept
+    in a grid of cell_size x cell_size cells by their top left corner for
+    query and pairs, cell_size must be larger than any entity.
+    """
+
+    # cells per second squared, and what is left of the horizontal speed
+    # of an entity after a step on the ground
+    gravity = 40.0
+    friction = 0.8
+
+    def __init__(self, world, cell_size=4):
+        self.world = world
+        self.cell_size = cell_size
+
+        self.x = array('d')
+        self.y = array('d')
+        self.vx = array('d')
+        self.vy = array('d')
+        self.kind = bytearray()
+        self.data = array('i')
+        self.asleep = bytearray()
+
+        # grid cell of every entity and the entities in every grid cell
+        self._keys = []
+        self._grid = {}
+        # changes from before the entities were there wake nothing
+        world.take_solid_changes()
+
+    def __len__(self):
+        return len(self.kind)
+
+    def spawn(self, kind, x, y, vx=0.0, vy=0.0, data=0):
+        """Add an entity of the kind named kind, returns its index"""
+        self.x.append(x)
+        self.y.append(max(y, 0.0))
+        self.vx.append(vx)
+        self.vy.append(vy)
+        self.kind.append(KIND_IDS[kind])
+        self.data.append(data)
+        self.asleep.append(0)
+        self._file(len(self.kind) - 1)
+        return len(self.kind) - 1
+
+    def remove(self, index):
+        """Remove an entity, the last one takes its index"""
+        last = len(self.kind) - 1
+        self._unfile(index)
+        if index != last:
+            self._unfile(last)
+        for field in (self.x, self.y, self.vx, self.vy, self.kind, self.data,
+                      self.asleep):
+            field[index] = field[-1]
+            del field[-1]
+        del self._keys[-1]
+        if index != last:
+            self._file(index)
+
+    @property
+    def resting(self):
+        """Whether every entity sleeps"""
+        return 0 not in self.asleep
+
+    def push(self, index, vx, vy):
+        """Add to the velocity of an entity, waking it up"""
+        self.vx[index] += vx
+        self.vy[index] += vy
+        self.asleep[index] = 0
+
+    def box(self, index):
+        """(x, y, width, height) of an entity in cells"""
+        kind = KINDS[self.kind[index]]
+        return self.x[index], self.y[index], kind.width, kind.height
+
+    def step(self, dt):
+        """Move every entity that is awake dt milliseconds forward"""
+        changes = self.world.take_solid_changes()
+        if changes and 1 in self.asleep:
+            # the ground may be gone from under the sleeping ones
+            self._wake_over(changes)
+
+        awake = [index for index, asleep in enumerate(self.asleep)
+                 if not asleep]
+        if not awake:
+            return
+        seconds = dt / 1000
+
+        self._move_x(awake, seconds)
+        self._move_y(awake, seconds)
+        self._refile(awake)
+
+    def _wake_over(self, columns):
+        """Wake the entities over any of the columns"""
+        size, grid = self.cell_size, self._grid
+        xs, kinds, asleep = self.x, self.kind, self.asleep
+        near = {bx for column in columns
+                for bx in range(floor(column - MAX_WIDTH) // size,
+                                column // size + 1)}
+        rows = range(self.world.height // size + 1)
+        for bx in near:
+            for by in rows:
+                for index in grid.get((bx, by), ()):
+                    x = xs[index]
+                    if asleep[index] and not columns.isdisjoint(
+                            range(floor(x), ceil(x + WIDTHS[kinds[index]]))):
+                        asleep[index] = 0
+
+    def _move_x(self, awake, seconds):
+        xs, ys, vxs, kinds = self.x, self.y, self.vx, self.kind
+        solid_column = self.world.solid_column
+        for index in awake:
+            vx = vxs[index]
+            if not vx:
+                continue
+            x = xs[index]
+            moved = x + vx * seconds
+            if vx > 0:
+                width = WIDTHS[kinds[index]]
+                columns = range(ceil(x + width), ceil(moved + width))
+            else:
+                columns = range(floor(x) - 1, floor(moved) - 1, -1)
+            if columns:
+                # the leading edge crossed into new columns
+                y = ys[index]
+                top = floor(y)
+                rows = ((1 << (ceil(y + HEIGHTS[kinds[index]]) - top)) - 1)\
+                    << top
+                for column in columns:
+                    if solid_column(column) & rows:
+                        moved = column - WIDTHS[kinds[index]] if vx > 0 else\
+                            column + 1
+                        vxs[index] = 0.0
+                        break
+            xs[index] = moved
+
+    def _move_y(self, awake, seconds):
+        xs, ys, vys, vxs, kinds = self.x, self.y, self.vy, self.vx, self.kind
+        asleep = self.asleep
+        friction = self.friction
+        solid_column = self.world.solid_column
+        pulls = [gravity * self.gravity * seconds for gravity in GRAVITIES]
+        for index in awake:
+            kind = kinds[index]
+            vy = vys[index] = vys[index] + pulls[kind]
+            if not vy:
+                continue
+            y = ys[index]
+            moved = y + vy * seconds
+            if vy > 0:
+                height = HEIGHTS[kind]
+                low, high = ceil(y + height), ceil(moved + height)
+            else:
+                low, high = max(floor(moved), 0), floor(y)
+            if low < high or moved < 0:
+                # the leading edge crossed into new rows
+                x = xs[index]
+                bits = 0
+                for column in range(floor(x), ceil(x + WIDTHS[kind])):
+                    bits |= solid_column(column)
+                crossed = bits >> low & ((1 << (high - low)) - 1)
+                if vy > 0 and crossed:
+                    # onto the first solid row on the way down
+                    moved = low + (crossed & -crossed).bit_length() - 1 -\
+                        HEIGHTS[kind]
+                    vys[index] = 0.0
+                    vx = vxs[index] * friction
+                    vxs[index] = vx if abs(vx) > 0.05 else 0.0
+                    if not vxs[index]:
+                        asleep[index] = 1
+                elif vy < 0 and (crossed or moved < 0):
+                    # under the last solid row on the way up
+                    moved = low + crossed.bit_length() if crossed else 0
+                    vys[index] = 0.0
+            ys[index] = moved
+
+    # grid cells are keyed by floats, equal to the int keys of query
+    def _file(self, index):
+        key = (self.x[index] // self.cell_size,
+               self.y[index] // self.cell_size)
+        if index == len(self._keys):
+            self._keys.append(key)
+        else:
+            self._keys[index] = key
+        self._grid.setdefault(key, set()).add(index)
+
+    def _unfile(self, index):
+        key = self._keys[index]
+        bucket = self._grid[key]
+        bucket.discard(index)
+        if not bucket:
+            del self._grid[key]
+
+    def _refile(self, indices):
+        """Move the entities to the grid cells they are in now"""
+        keys, grid, size = self._keys, self._grid, self.cell_size
+        xs, ys = self.x, self.y
+        for index in indices:
+            key = (xs[index] // size, ys[index] // size)
+            if key != keys[index]:
+                self._unfile(index)
+                keys[index] = key
+                grid.setdefault(key, set()).add(index)
+
+    def _overlap(self, i, x, y, width, height):
+        kind = KINDS[self.kind[i]]
+        ix, iy = self.x[i], self.y[i]
+        return ix < x + width and x < ix + kind.width and\
+            iy < y + height and y < iy + kind.height
+
+    def query(self, x, y, width, height):
+        """Indices of the entities overlapping the rect"""
+        size = self.cell_size
+        found = []
+        for bx in range(floor(x - MAX_WIDTH) // size,
+                        floor(x + width) // size + 1):
+            for by in range(floor(y - MAX_HEIGHT) // size,
+                            floor(y + height) // size + 1):
+                for index in self._grid.get((bx, by), ()):
+                    if self._overlap(index, x, y, width, height):
+                        found.append(index)
+        return found
+
+    def pairs(self):
+        """Pairs (i, j), i < j, of entities that overlap"""
+        found = []
+        grid = self._grid
+        for (bx, by), bucket in grid.items():
+            neighbours = [grid.get((bx + dx, by + dy), ())
+                          for dx, dy in ((1, 0), (-1, 1), (0, 1), (1, 1))]
+            for i in bucket:
+                box = self.box(i)
+                for j in bucket:
+                    if i < j and self._overlap(j, *box):
+                        found.append((i, j))
+                for other in neighbours:
+                    for j in other:
+                        if self._overlap(j, *box):
+                            found.append((i, j) if i < j else (j, i))
+        return found
@@ -1,8 +1,9 @@
 from collections import OrderedDict
 
 from .world.world import World
+from .world import collision
 import sdl2
-from .utils import Coord, signof, ceil_abs, point_in_rect, Drawable, UiHelper,\
+from .utils import Coord, ceil_abs, point_in_rect, Drawable, UiHelper,\
     to_rgb
 
 
@@ -19,9 +20,7 @@ class InventoryItem(Drawable):
     def draw(self, surface, x, y):
         super().draw(surface, x, y)
 
-        qty_texture = UiHelper.sprite_factory.from_text(
-            str(self.qty), fontmanager=UiHelper.font_manager
-        )
+        qty_texture = UiHelper.text_cache.get(str(self.qty))
 
         super().draw(surface, x, y, sprite=qty_texture)
 
@@ -83,16 +82,12 @@ class Inventory(Drawable):
     def update(self):
         if len(self.slots) == 0:
             self.width = 0
+            self.dirty = False
             return False
 
         if self.dirty:
             self.width = len(self.slots) * self.size +\
                 (len(self.slots) + 1) * self.padding
-            del self.sprite
-            self.sprite = UiHelper.sprite_factory.from_color(
-                to_rgb(0, 0, 0),
-                (self.width, self.height)
-            )
         self.dirty = False
         return True
 
@@ -102,7 +97,9 @@ class Inventory(Drawable):
 
         self.last_pos = [x, y, self.width]
 
-        super().draw(surface, x, y)
+        sdl2.surface.SDL_FillRect(
+            surface, sdl2.rect.SDL_Rect(x, y, self.width, self.height),
+            to_rgb(0, 0, 0))
         y += self.padding
         for index, item in enumerate(self.slots.values()):
             if self.selected_index == index:
@@ -116,6 +113,9 @@ class Inventory(Drawable):
 
 class Player(Drawable):
 
+    # milliseconds of game time per step of the player physics
+    STEP = 1000 / 30
+
     def __init__(self, world, sprite):
         super().__init__(sprite)
 
@@ -131,10 +131,14 @@ class Player(Drawable):
         self.velocity = Coord(0, self.speed)
 
         self.world = world
-        self.last_tick = sdl2.timer.SDL_GetTicks()
+        # game time not yet run through the physics
+        self.lag = 0
 
-        self.position.pos = [self.world.width // 2, 0]
-        self.tick()
+        spawn = self.world.width // 2
+        self.position.pos = [
+            spawn, max(self.world.surface_height(spawn) - self.size.y, 0)
+        ]
+        self.tick(0)
 
     def check_dirty(self):
         self.dirty = self.dirty or self.inventory.dirty
@@ -176,90 +180,70 @@ class Player(Drawable):
         self.dirty = True
         self.world[x][y].dirty = True
 
-    def pick(self):
-        for x in self.world.in_width(self.position.x,
-                                     self.position.x + self.size.x):
-            for y in self.world.in_height(self.position.y,
-                                          self.position.y + self.size.y):
-                pick = self.world.pick(x, y)
-                self.world[x][y].dirty = True
-                if pick:
-                    self.inventory.add(pick)
-
-    def tick(self):
+    def pick(self, area=None):
+        """Pick up the drops in area, (x, y, width, height) in cells, by
+        default the cells the player is in"""
+        for x, y in self.world.drops_in(*area or (
+                self.position.x, self.position.y, self.size.x, self.size.y)):
+            self.inventory.add(self.world.pick(x, y))
+
+    def tick(self, dt):
+        """Advance dt milliseconds, a physics step for every STEP of them"""
         self.pick()
-        self.inventory.update()
 
-        now = sdl2.timer.SDL_GetTicks()
-        if now - self.last_tick <= 33:
-            return
-        self.last_tick = now
+        self.lag += dt
+        while self.lag >= self.STEP:
+            self.lag -= self.STEP
+            self.physics()
+
+    @property
+    def resting(self):
+        """Standing still on solid ground"""
+        x, y = self.position.x, self.position.y + self.size.y
+        return not any(self.velocity) and\
+            (not self.world.valid(x, y) or self.world[x][y].solid)
 
-        prev_pos = Coord(*self.position.pos)
+    def physics(self):
+        x, y = self.position.pos
+        width, height = self.size.pos
 
-        if self.world.valid(self.position.x, self.position.y + self.size.y)\
-            and not self.world[self.position.x][self.position.y + self.size.y]\
-                .solid:
+        if not collision.blocked(self.world, x, y + height, width):
             self.velocity.y += 1
-        elif self.world.valid(self.position.x, self.position.y - 1) and\
-            self.world[self.position.x][self.position.y - 1].solid and\
-                self.velocity.y < 0:
+        elif self.velocity.y < 0 and y > 0 and\
+                collision.blocked(self.world, x, y - 1, width):
             self.velocity.y = 0
         elif self.velocity.y > 0:
             self.velocity.y = 0
 
-        x_direction = signof(self.velocity.x)
-
-        for x in self.world.pointed_range(
-                self.position.x + self.size.x * (x_direction == 1),
-                self.position.x + ceil_abs(self.velocity.x)
-                + self.size.x * (x_direction == 1)):
-            solid = False
-            for y in self.world.in_height(self.position.y,
-                                          self.position.y + self.size.y):
-                solid = self.world[x][y].solid or solid
-
-            if not solid:
-                step = x_direction if abs(self.velocity.x) >= 1\
-                    else self.velocity.x
-                self.position.x += step
-                self.velocity.x -= step
-                self.pick()
-            else:
-                self.velocity.x = 0
-                if self.auto_jump:
-                    self.jump()
-                break
-
-        y_direction = signof(self.velocity.y)
-        for y in self.world.pointed_range(
-                self.position.y + self.size.y * (y_direction == 1),
-                self.position.y + self.size.y * (y_direction == 1)
-                + self.velocity.y):
-            if not self.world[self.position.x][y].solid:
-                self.position.y += 1 * y_direction
-                self.pick()
-            else:
-                if self.velocity.y < 0:
-                    self.velocity.y = 0
-                break
-
-        if prev_pos != self.position:
+        if self.velocity.x:
+            contact = collision.sweep(self.world, x, y, width, height,
+                                      ceil_abs(self.velocity.x), 0)
+            self.velocity.x = 0
+            self.pick((min(x, contact.x), y,
+                       abs(contact.x - x) + width, height))
+            x = contact.x
+            if contact.normal[0] and self.auto_jump:
+                self.jump()
+
+        if self.velocity.y:
+            contact = collision.sweep(self.world, x, y, width, height,
+                                      0, self.velocity.y)
+            if contact.normal[1] == 1:
+                self.velocity.y = 0
+            self.pick((x, min(y, contact.y),
+                       width, abs(contact.y - y) + height))
+            y = contact.y
+
+        if (x, y) != tuple(self.position.pos):
+            self.position.pos = [x, y]
             self.dirty = True
-            for x in self.world.in_width(min(prev_pos.x, self.position.x),
-                                         max(prev_pos.x, self.position.x)
-                                         + self.size.x):
-                for y in self.world.in_height(min(prev_pos.y, self.position.y),
-                                              max(prev_pos.y, self.position.y)
-                                              + self.size.y):
-                    self.world[x][y].dirty = True
 
         self.check_dirty()
 
     def jump(self):
         # no air jumping
-        if not self.world[self.position[0]][self.position[1] + self.size[1]]\
-                .solid:
+        if not collision.blocked(self.world, self.position.x,
+                                 self.position.y + self.size.y, self.size.x):
             return
 
         self.velocity.y -= self.speed * 3
@@ -0,0 +1,119 @@
+from array import array
+from math import ceil
+from time import perf_counter
+import csv
+import json
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of a sorted sequence, 0 if it is empty"""
+    if not values:
+        return 0
+    return values[max(ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class Profiler:
+
+    """Milliseconds spent in named phases of each of the last frames.
+
+    measure runs a function and adds the time it took to its phase of the
+    current frame, end_frame keeps the frame in a ring buffer of the last
+    frames and starts the next one. A phase run several times in a frame,
+    like a simulation step catching up, counts once with the sum.
+
+    add counts things done in the current frame, like blits, for each of
+    the named counters. They are kept in the ring buffer with the times.
+    """
+
+    def __init__(self, phases, frames=600, clock=perf_counter, counters=()):
+        self.phases = tuple(phases)
+        self.counters = tuple(counters)
+        self.frames = frames
+        self.clock = clock
+        # frames ended so far, the ring buffer holds the last of them
+        self.count = 0
+        self._times = {phase: array('d', bytes(8 * frames))
+                       for phase in self.phases}
+        self._counts = {counter: array('q', bytes(8 * frames))
+                        for counter in self.counters}
+        self._frame = dict.fromkeys(self.phases, 0.0)
+        self._added = dict.fromkeys(self.counters, 0)
+
+    def __len__(self):
+        return min(self.count, self.frames)
+
+    def measure(self, phase, function, *args):
+        """Call function with args, timing it as phase"""
+        start = self.clock()
+        result = function(*args)
+        self._frame[phase] += self.clock() - start
+        return result
+
+    def add(self, counter, amount=1):
+        """Add amount to counter in the current frame"""
+        self._added[counter] += amount
+
+    def end_frame(self):
+        index = self.count % self.frames
+        for phase, seconds in self._frame.items():
+            self._times[phase][index] = seconds * 1000
+            self._frame[phase] = 0.0
+        for counter, amount in self._added.items():
+            self._counts[counter][index] = amount
+            self._added[counter] = 0
+        self.count += 1
+
+    def samples(self, name):
+        """Times of a phase or counts of a counter from the oldest frame
+        kept to the newest"""
+        values = self._times[name] if name in self._times else\
+            self._counts[name]
+        if self.count <= self.frames:
+            return values[:self.count]
+        index = self.count % self.frames
+        return values[index:] + values[:index]
+
+    def header(self):
+        """Names of the columns of rows"""
+        return self.phases + ('total',) + self.counters
+
+    def rows(self):
+        """Times of every phase, their total and the counts of every
+        counter, a row per frame kept"""
+        phases = len(self.phases)
+        return [row[:phases] + (sum(row[:phases]),) + row[phases:]
+                for row in zip(*(self.samples(name) for name in
+                                 self.phases + self.counters))]
+
+    def stats(self):
+        """min, avg, p95 and p99 of every phase and of the total, in
+        milliseconds, and of every counter"""
+        header = self.header()
+        columns = list(zip(*self.rows())) or [()] * len(header)
+        stats = {}
+        for phase, times in zip(header, columns):
+            times = sorted(times)
+            stats[phase] = {
+                'min': times[0] if times else 0,
+                'avg': sum(times) / len(times) if times else 0,
+                'p95': percentile(times, 95),
+                'p99': percentile(times, 99),
+            }
+        return stats
+
+    def dump(self, file_path):
+        """Write the frames kept to file_path, as CSV if its name ends in
+        .csv, JSON with the stats otherwise"""
+        header = self.header()
+        with open(file_path, 'w', newline='') as output:
+            if file_path.endswith('.csv'):
+                writer = csv.writer(output)
+                writer.writerow(header)
+                writer.writerows(self.rows())
+            else:
+                json.dump({
+                    'columns': header,
+                    'stats': self.stats(),
+                    'frames': self.rows(),
+                }, output, indent=2)
+                output.write('\n')
@@ -0,0 +1,238 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+
+import sdl2
+
+from .world.world import Cell
+from .world.lighting import MAX_LIGHT
+
+
+class ChunkCache:
+
+    """Surfaces of chunk_size x chunk_size world cells with their tiles and
+    drops already blitted, so drawing a part of the world takes a blit per
+    chunk instead of one or two per cell.
+
+    Chunks are baked the first time they are drawn and kept in a LRU of at
+    most max_chunks surfaces. Cells that change are painted again in the
+    surface of their chunk, see update. With workers chunks about to come
+    into view can be baked ahead in a thread pool, see prefetch. The world
+    is only ever read on the calling thread, the pool only blits.
+
+    Cells are drawn as bright as their light level in world.lighting,
+    from copies of their sprites darkened once for every level, see shade.
+    Cells without light are darkest times as bright as lit ones.
+
+    blits and surfaces count the chunk blits and the surfaces made so far,
+    bakes started in the pool included.
+    """
+
+    darkest = 0.2
+
+    def __init__(self, world, block_size, pixel_format, chunk_size=16,
+                 max_chunks=64, workers=None):
+        self.world = world
+        self.block_size = block_size
+        self.pixel_format = pixel_format
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+
+        self._chunks = OrderedDict()
+        self._pending = {}
+        self._sources = {}
+        self._shades = {}
+        self._pool = ThreadPoolExecutor(workers) if workers else None
+        self.blits = 0
+        self.surfaces = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def shade(self, sprite, level):
+        """Surface of sprite as bright as light level. Every level, full
+        light included, is blitted from a copy of the sprite only shade
+        uses, so the surfaces the pool blits from are never changed."""
+        level = min(level, MAX_LIGHT)
+        surface = self._shades.get((sprite, level))
+        if surface is not None:
+            return surface
+
+        source = self._sources.get(sprite)
+        if source is None:
+            source = self._sources[sprite] = self._copy(sprite.surface)
+            self.surfaces += 1
+        contents = source.contents
+        self.surfaces += 1
+        surface = self._shades[(sprite, level)] =\
+            sdl2.surface.SDL_CreateRGBSurfaceWithFormat(
+                0, contents.w, contents.h, 32,
+                contents.format.contents.format)
+        blend = sdl2.blendmode.SDL_BlendMode()
+        sdl2.surface.SDL_GetSurfaceBlendMode(sprite.surface,
+                                             ctypes.byref(blend))
+        sdl2.surface.SDL_SetSurfaceBlendMode(surface, blend)
+
+        value = round(255 * (self.darkest +
+                             (1 - self.darkest) * level / MAX_LIGHT))
+        sdl2.surface.SDL_SetSurfaceColorMod(source, value, value, value)
+        sdl2.surface.SDL_BlitSurface(source, None, surface, None)
+        return surface
+
+    @staticmethod
+    def _copy(source):
+        """Copy of surface source that blits as is, alpha included. The
+        pixels are copied row by row, blitting from source would change
+        it."""
+        surface = sdl2.surface.SDL_CreateRGBSurfaceWithFormat(
+            0, source.w, source.h, 32, source.format.contents.format)
+        contents = surface.contents
+        row = source.w * 4
+        for y in range(source.h):
+            ctypes.memmove(contents.pixels + y * contents.pitch,
+                           source.pixels + y * source.pitch, row)
+        sdl2.surface.SDL_SetSurfaceBlendMode(
+            surface, sdl2.blendmode.SDL_BLENDMODE_NONE)
+        return surface
+
+    def _cell(self, x, y):
+        """Where to blit the sprite surfaces of a cell in its chunk and
+        what to blit"""
+        cell = Cell(self.world, x, y)
+        level = self.world.lighting.level(x, y)
+        drop = self.shade(cell.drop_sprite, level) if cell.pickable else None
+        return (x % self.chunk_size * self.block_size,
+                y % self.chunk_size * self.block_size,
+                self.shade(cell.sprite, level), drop)
+
+    def _plan(self, key):
+        """Sprite surfaces and where to blit them for every cell of a chunk,
+        read on the calling thread"""
+        cx, cy = key
+        return [self._cell(x, y)
+                for x in self.world.in_width(cx * self.chunk_size,
+                                             (cx + 1) * self.chunk_size)
+                for y in self.world.in_height(cy * self.chunk_size,
+                                              (cy + 1) * self.chunk_size)]
+
+    def _paint(self, surface, plan):
+        half = sdl2.rect.SDL_Rect(0, 0, self.block_size // 2,
+                                  self.block_size // 2)
+        inset = self.block_size // 5
+        for x, y, tile, drop in plan:
+            sdl2.surface.SDL_BlitSurface(
+                tile, None, surface, sdl2.rect.SDL_Rect(x, y, 0, 0))
+            if drop is not None:
+                sdl2.surface.SDL_BlitSurface(
+                    drop, half, surface,
+                    sdl2.rect.SDL_Rect(x + inset, y + inset, 0, 0))
+        return surface
+
+    def _bake(self, plan):
+        size = self.chunk_size * self.block_size
+        surface = sdl2.surface.SDL_CreateRGBSurfaceWithFormat(
+            0, size, size, 32, self.pixel_format)
+        return self._paint(surface, plan)
+
+    def chunk(self, key):
+        """Baked surface of a chunk"""
+        surface = self._chunks.get(key)
+        if surface is not None:
+            self._chunks.move_to_end(key)
+            return surface
+
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            surface = pending.result()
+        else:
+            surface = self._bake(self._plan(key))
+            self.surfaces += 1
+
+        self._chunks[key] = surface
+        while len(self._chunks) > self.max_chunks:
+            sdl2.surface.SDL_FreeSurface(self._chunks.popitem(last=False)[1])
+        return surface
+
+    def prefetch(self, columns, rows):
+        """Start baking the chunks of the cells in columns x rows that are
+        not baked yet, does nothing without workers. Chunks still being
+        baked from an earlier call that are out of columns x rows now are
+        dropped, so only one window of them is ever kept."""
+        if self._pool is None:
+            return
+
+        keys = self._keys(columns, rows)
+        for key in self._pending.keys() - set(keys):
+            self._drop(key)
+        for key in keys:
+            if key not in self._chunks and key not in self._pending:
+                self._pending[key] = self._pool.submit(
+                    self._bake, self._plan(key))
+                self.surfaces += 1
+
+    def _drop(self, key):
+        """Forget the chunk being baked for key, freed whenever it is
+        done if it can not be cancelled"""
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.cancel():
+            self.surfaces -= 1
+        else:
+            pending.add_done_callback(
+                lambda done: sdl2.surface.SDL_FreeSurface(done.result()))
+
+    def update(self, x, y):
+        """Paint a changed cell again in its chunk, if that is baked"""
+        key = (x // self.chunk_size, y // self.chunk_size)
+        surface = self._chunks.get(key)
+        if surface is not None:
+            self._paint(surface, [self._cell(x, y)])
+        # baked from a stale plan
+        self._drop(key)
+
+    def _keys(self, columns, rows):
+        size = self.chunk_size
+        if not len(columns) or not len(rows):
+            return []
+        return [(cx, cy)
+                for cx in range(columns[0] // size, columns[-1] // size + 1)
+                for cy in range(rows[0] // size, rows[-1] // size + 1)]
+
+    def blit(self, columns, rows, target, offset):
+        """Blit the cells in ranges columns x rows to target as seen from
+        offset (world coordinates of the top left corner of target).
+        Returns the rect of target that was drawn."""
+        columns = range(max(columns.start, 0),
+                        min(columns.stop, self.world.width))
+        rows = range(max(rows.start, 0), min(rows.stop, self.world.height))
+        size = self.chunk_size
+        block = self.block_size
+
+        for cx, cy in self._keys(columns, rows):
+            low_x = max(columns.start, cx * size)
+            high_x = min(columns.stop, (cx + 1) * size)
+            low_y = max(rows.start, cy * size)
+            high_y = min(rows.stop, (cy + 1) * size)
+            self.blits += 1
+            sdl2.surface.SDL_BlitSurface(
+                self.chunk((cx, cy)),
+                sdl2.rect.SDL_Rect((low_x - cx * size) * block,
+                                   (low_y - cy * size) * block,
+                                   (high_x - low_x) * block,
+                                   (high_y - low_y) * block),
+                target,
+                sdl2.rect.SDL_Rect((low_x - offset.x) * block,
+                                   (low_y - offset.y) * block, 0, 0))
+
+        return sdl2.rect.SDL_Rect(
+            (columns.start - offset.x) * block,
+            (rows.start - offset.y) * block,
+            len(columns) * block, len(rows) * block)
+
+    def clear(self):
+        for key in list(self._pending):
+            self._drop(key)
+        for surface in self._chunks.values():
+            sdl2.surface.SDL_FreeSurface(surface)
+        self._chunks.clear()
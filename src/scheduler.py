@@ -0,0 +1,70 @@
+import sdl2
+
+
+class Scheduler:
+
+    """Game loop running the simulation in fixed steps of game time and
+    rendering in between.
+
+    Time from clock (milliseconds) piles up and step is called with step_ms
+    for every step_ms of it, at most max_steps times a frame. When the game
+    falls further behind than that the rest of the time is dropped, so a
+    slow frame slows the game down instead of making every following frame
+    slower. render is called every frame and should only draw what changed.
+    What is left of frame_ms after a frame is spent waiting for events, or
+    idle_ms when idle says nothing is going on, so input still wakes the
+    loop right away. events returns True to stop.
+    """
+
+    def __init__(self, clock, events, step, render, idle=None,
+                 step_ms=1000 / 60, frame_ms=1000 / 60, max_steps=8,
+                 idle_ms=100):
+        self.clock = clock
+        self.events = events
+        self.step = step
+        self.render = render
+        self.idle = idle or (lambda: False)
+
+        self.step_ms = step_ms
+        self.frame_ms = frame_ms
+        self.max_steps = max_steps
+        self.idle_ms = idle_ms
+
+        # milliseconds of the last frames, smoothed
+        self.frame_time = 0
+        self.dropped = 0
+
+    def run(self, report=None):
+        """Loop until events returns True, calling report with frame_time
+        about once a second if given"""
+        previous = last_report = self.clock()
+        accumulator = 0
+        while True:
+            start = self.clock()
+            accumulator += start - previous
+            previous = start
+
+            if self.events():
+                return
+
+            steps = 0
+            while accumulator >= self.step_ms and steps < self.max_steps:
+                self.step(self.step_ms)
+                accumulator -= self.step_ms
+                steps += 1
+            if accumulator >= self.step_ms:
+                self.dropped += accumulator - accumulator % self.step_ms
+                accumulator %= self.step_ms
+
+            self.render()
+
+            now = self.clock()
+            self.frame_time = 0.75 * self.frame_time + 0.25 * (now - start)
+            if report is not None and now - last_report > 1000:
+                last_report = now
+                report(self.frame_time)
+
+            wait = self.idle_ms if self.idle() else\
+                self.frame_ms - (now - start)
+            if wait >= 1:
+                sdl2.SDL_WaitEventTimeout(None, int(wait))
@@ -1,20 +1,64 @@
+import os
 import sys
 from os import path, name as OS_NAME
 
 import sdl2.ext
-from sdl2 import timer, surface, video, rect
+from sdl2 import timer, video, rect
 
-from .utils import bind_in_range, Coord, point_in_rect, to_rgb, UiHelper
+from .utils import bind_in_range, Coord, point_in_rect, UiHelper,\
+    signof, ceil, TextCache
 from .world.world_generator import WorldGenerator
-from .world.world import WorldObject
+from .world.world import World, WorldObject
+from .world.chunked_world import ChunkedWorld
 from .player import Player
+from .render_cache import ChunkCache
+from .compositor import Compositor, Layer, SpriteLayer
+from .entities import Entities, KIND_IDS
+from .scheduler import Scheduler
+from .profiler import Profiler
+from .textures import TextureLoader
 
 
 class PyCraft():
     WIDTH, HEIGHT = 1300, 700
     BLOCK_SIZE = 20
 
+    # marks the cells drawn and shows the frame profile, F3 toggles it
     DEBUG = False
+    # frames the profiler keeps, and what it times and counts in each
+    PROFILE_FRAMES = 600
+    PROFILE_PHASES = ('events', 'player.tick', 'world.tick', 'entities.step',
+                      'focus_player', 'update_screen', 'draw_entities',
+                      'draw_player', 'window.refresh')
+    PROFILE_COUNTERS = ('chunk_blits', 'surfaces')
+
+    # milliseconds of game time per simulation step and per frame drawn,
+    # at most MAX_STEPS steps are caught up on in a frame
+    STEP_MS = 1000 / 60
+    FRAME_MS = 1000 / 60
+    MAX_STEPS = 8
+    # milliseconds to wait for input when nothing moves
+    IDLE_MS = 100
+
+    # follow the player a 1 / SCROLL_EASE of the way every step
+    SMOOTH_SCROLL = True
+    SCROLL_EASE = 4
+
+    CHUNKED = True
+    WORLD_SIZE = (100, 100)
+    SEED = None
+    # processes generating the world, None generates it in this one
+    WORKERS = None
+
+    # blocks per side of the pre-rendered chunks of the world and threads
+    # rendering them ahead of the view, None renders them when needed
+    RENDER_CHUNK = 16
+    RENDER_WORKERS = None
+
+    # threads decoding the block textures, and a directory to keep them
+    # decoded in for the next start, None for neither
+    TEXTURE_WORKERS = None
+    TEXTURE_CACHE = None
 
     blocks_in_width = WIDTH // BLOCK_SIZE
     blocks_in_height = HEIGHT // BLOCK_SIZE
@@ -24,17 +68,55 @@ class PyCraft():
         HEIGHT // (5 * BLOCK_SIZE)
     )
 
-    def __init__(self, RESOURCE_DIR):
+    def __init__(self, RESOURCE_DIR, save_file=None, world=None,
+                 surface=None, clock=timer.SDL_GetTicks, headless=False):
+        """Set up the game without running it, see run, or step and render.
+
+        world is used instead of loading save_file or generating one.
+        surface is an SDL_Surface pointer to draw on instead of a window,
+        headless draws on an offscreen surface and needs no display.
+        clock returns milliseconds and paces the run loop only, step
+        advances the game time by whatever it is given.
+        """
+        if headless:
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
         WorldObject.init(RESOURCE_DIR)
         self.RESOURCES = sdl2.ext.Resources(RESOURCE_DIR)
         sdl2.ext.init()
 
-        self.window = sdl2.ext.Window("Py-craft",
-                                      size=(self.WIDTH, self.HEIGHT))
-        self.window.show()
-
-        self.p_surface = self.window.get_surface()
-        self.c_surface = video.SDL_GetWindowSurface(self.window.window)
+        self.save_file = save_file
+        self.clock = clock
+        self.time = 0
+        self.profiler = Profiler(self.PROFILE_PHASES, self.PROFILE_FRAMES,
+                                 counters=self.PROFILE_COUNTERS)
+        # totals of the counters at the end of the last frame
+        self.counted = dict.fromkeys(self.PROFILE_COUNTERS, 0)
+
+        self.window = None
+        if surface is None and headless:
+            surface = sdl2.surface.SDL_CreateRGBSurfaceWithFormat(
+                0, self.WIDTH, self.HEIGHT, 32,
+                sdl2.pixels.SDL_PIXELFORMAT_RGB888)
+        elif surface is None:
+            self.window = sdl2.ext.Window("Py-craft",
+                                          size=(self.WIDTH, self.HEIGHT))
+            self.window.show()
+            surface = video.SDL_GetWindowSurface(self.window.window)
+
+        self.c_surface = surface
+        self.p_surface = surface.contents
+
+        # the world is drawn on a layer of its own under the player and the
+        # HUD, which the compositor puts together on screen
+        self.compositor = Compositor(surface, self.WIDTH, self.HEIGHT)
+        self.world_surface = self.create_surface(self.WIDTH, self.HEIGHT)
+        self.scroll_surface = self.create_surface(self.WIDTH, self.HEIGHT)
+        self.world_layer = self.compositor.add(Layer(
+            self.world_surface, 0, 0,
+            rect.SDL_Rect(0, 0, self.WIDTH, self.HEIGHT)))
+        self.entity_layer = self.compositor.add(SpriteLayer())
+        self.drawn_entities = set()
 
         UiHelper.font_manager = self.font_manager = sdl2.ext.FontManager(
             self.RESOURCES.get_path('helvetica-neue-bold.ttf')
@@ -42,73 +124,139 @@ class PyCraft():
 
         UiHelper.sprite_factory = self.sprite_factory =\
             sdl2.ext.SpriteFactory(sdl2.ext.SOFTWARE)
+        UiHelper.text_cache = TextCache()
 
         UiHelper.BLOCK_SIZE = self.BLOCK_SIZE
 
         self.offset = Coord(0, 0)  # offset in world coordinates
-        self.world = WorldGenerator.generate_world(None, (100, 100))
+        self.target = Coord(0, 0)  # offset the view is scrolling to
+        self.drawn_offset = Coord(0, 0)  # offset of what is on screen
+        self.exposed = []  # (columns, rows) of cells to draw after scrolls
+        if world is not None:
+            self.world = world
+        elif save_file is not None and path.exists(save_file):
+            if self.CHUNKED:
+                self.world = ChunkedWorld.load(save_file)
+            else:
+                self.world = World.load(save_file)
+        elif self.CHUNKED:
+            self.world = ChunkedWorld(self.WORLD_SIZE[1], seed=self.SEED)
+            self.world.pregenerate(self.world.width // 2,
+                                   self.blocks_in_width, self.WORKERS)
+        else:
+            self.world = WorldGenerator.generate_world(
+                None, self.WORLD_SIZE, vectorized=True, seed=self.SEED,
+                workers=self.WORKERS)
+
+        self.entities = Entities(self.world)
 
         self.dirty = True
         UiHelper.texture_map = {}
+        self.init()
 
-        sprite = self.sprite_factory.from_image(
-            self.RESOURCES.get_path('player.png')
-        )
+        sprite = self.sprite_factory.from_surface(
+            self.textures.image('player.png'), True)
         self.player = Player(self.world, sprite)
-
-        self.init()
-        self.world.tick()
-        self.loop()
+        self.player_layer = self.compositor.add(Layer(sprite.surface))
+        self.hud_surface = self.create_surface(
+            self.WIDTH, self.player.inventory.height)
+        self.hud_layer = self.compositor.add(Layer(self.hud_surface))
+        self.projectile_surface = self.textures.color((230, 230, 230))
+        rows = len(self.PROFILE_PHASES) + len(self.PROFILE_COUNTERS) + 2
+        self.profile_surface = self.create_surface(380, 20 * rows)
+        self.profile_layer = self.compositor.add(Layer(self.profile_surface))
+        # the overlay changes every frame, kept apart from the text of the
+        # hud so its numbers do not evict the quantities of the inventory
+        self.profile_text = TextCache(2 * 5 * rows)
+
+        chunks = (self.blocks_in_width // self.RENDER_CHUNK + 2) *\
+            (self.blocks_in_height // self.RENDER_CHUNK + 2)
+        self.chunk_cache = ChunkCache(
+            self.world, self.BLOCK_SIZE, self.pixel_format(),
+            self.RENDER_CHUNK, 2 * chunks, self.RENDER_WORKERS)
+
+        self.world.settle()
+        self.focus_player(snap=True)
+
+    def pixel_format(self):
+        return self.p_surface.format.contents.format
+
+    def create_surface(self, width, height):
+        """Surface in the pixel format of the screen"""
+        return sdl2.surface.SDL_CreateRGBSurfaceWithFormat(
+            0, width, height, 32, self.pixel_format())
 
     def init(self):
-        for row in self.world:
-            for el in row:
-                key = el.get_key()
-                if key not in UiHelper.texture_map:
-                    if el.has_prop('image'):
-                        el.sprite = UiHelper.texture_map[key] =\
-                            self.sprite_factory.from_image(
-                                self.RESOURCES.get_path(el.image)
-                            )
-                    else:
-                        el.sprite = UiHelper.texture_map[key] =\
-                            self.sprite_factory.from_color(
-                                to_rgb(*el.color),
-                                (self.BLOCK_SIZE, self.BLOCK_SIZE)
-                            )
-                    if el.has_prop('images'):
-                        for img in el.images:
-                            UiHelper.texture_map[img] =\
-                                self.sprite_factory.from_image(
-                                    self.RESOURCES.get_path(img)
-                                )
-                else:
-                    el.sprite = UiHelper.texture_map[key]
+        """Load the textures of every block type"""
+        self.textures = TextureLoader(
+            self.RESOURCES, self.pixel_format(), self.BLOCK_SIZE,
+            self.TEXTURE_WORKERS, self.TEXTURE_CACHE)
+        for key, surface in self.textures.load(WorldObject.types).items():
+            UiHelper.texture_map[key] =\
+                self.sprite_factory.from_surface(surface, True)
+
+        UiHelper.sprites = [UiHelper.texture_map[key]
+                            for key in WorldObject.sprite_keys]
+
+    def run(self):
+        """Play until quit, then save the world if there is a save file"""
+        self.loop()
+        if self.save_file is not None:
+            self.world.save(self.save_file)
 
     def loop(self):
-
-        last_tick = timer.SDL_GetTicks()
-        avg_time = 0
-        while True:
-            start = timer.SDL_GetTicks()
-
-            if self.events():
-                return
-
-            self.player.tick()
-            # self.world.tick() # optimize to be called on every frame
-            self.focus_player()
-            self.draw()
+        """Run until the window is closed, stepping the game every STEP_MS
+        and drawing what changed"""
+        Scheduler(self.clock,
+                  lambda: self.profiler.measure('events', self.events),
+                  self.step, self.render, self.idle, self.STEP_MS,
+                  self.FRAME_MS, self.MAX_STEPS,
+                  self.IDLE_MS).run(lambda frame_time: self.draw_profile())
+
+    def step(self, dt):
+        """Advance the game by dt milliseconds"""
+        measure = self.profiler.measure
+        self.time += dt
+        measure('player.tick', self.player.tick, dt)
+        measure('world.tick', self.world.tick, dt)
+        measure('entities.step', self.entities.step, dt)
+        measure('focus_player', self.focus_player)
+
+    def idle(self):
+        """Whether nothing moves or waits to be updated right now"""
+        return self.player.resting and not self.player.dirty and\
+            self.offset == self.target and\
+            not self.world.updates.queued and self.entities.resting and\
+            self.world.automaton.settled
+
+    def render(self):
+        """Draw what changed since the last render and show only that,
+        ending the frame of the profiler"""
+        rects = self.draw()
+        if self.window is not None:
+            self.profiler.measure('window.refresh', self.present, rects)
+        self.count_frame()
+        self.profiler.end_frame()
+
+    def count_frame(self):
+        """Add what the caches did since the last frame to the profiler"""
+        totals = {
+            'chunk_blits': self.chunk_cache.blits,
+            'surfaces': self.chunk_cache.surfaces +
+            UiHelper.text_cache.surfaces + self.profile_text.surfaces,
+        }
+        for counter, total in totals.items():
+            self.profiler.add(counter, total - self.counted[counter])
+        self.counted = totals
+
+    def present(self, rects):
+        """Show the screen rects drawn, all of it for None"""
+        if rects is None:
             self.window.refresh()
-
-            now = timer.SDL_GetTicks()
-            if now - last_tick > 1000:
-                last_tick = now
-                print(int(avg_time))
-
-            avg_time = 0.75 * avg_time + 0.25 * (now - start)
-
-            timer.SDL_Delay(1000 // 60)
+        elif rects:
+            video.SDL_UpdateWindowSurfaceRects(
+                self.window.window, (rect.SDL_Rect * len(rects))(*rects),
+                len(rects))
 
     def world_to_screen(self, x, y):
         return (
@@ -130,91 +278,161 @@ class PyCraft():
             map(int, self.world_to_screen(world_rect[2], world_rect[3]))
         )
         x2, y2 = x2 - 1, y2 - 1
-        sdl2.ext.line(self.p_surface, 0xff0000, (x1, y1, x2, y1))
-        sdl2.ext.line(self.p_surface, 0xff0000, (x2, y1, x2, y2))
-        sdl2.ext.line(self.p_surface, 0xff0000, (x1, y1, x1, y2))
-        sdl2.ext.line(self.p_surface, 0xff0000, (x1, y2, x2, y2))
+        world_surface = self.world_surface.contents
+        sdl2.ext.line(world_surface, 0xff0000, (x1, y1, x2, y1))
+        sdl2.ext.line(world_surface, 0xff0000, (x2, y1, x2, y2))
+        sdl2.ext.line(world_surface, 0xff0000, (x1, y1, x1, y2))
+        sdl2.ext.line(world_surface, 0xff0000, (x1, y2, x2, y2))
 
     def update_screen(self):
+        """Blit the visible cells changed since the last call and those
+        scrolled into view, or all of them if self.dirty, from the chunk
+        cache to the world layer. Returns the screen rects blitted.
+        Changed cells out of view are only painted again in the cache."""
+        changed = self.world.take_dirty()
+        for x, y in changed:
+            self.chunk_cache.update(x, y)
+
+        columns = range(self.offset.x, self.offset.x + self.blocks_in_width)
+        rows = range(self.offset.y, self.offset.y + self.blocks_in_height)
+
+        if self.dirty:
+            areas = [(columns, rows)]
+        else:
+            areas = [(range(x, x + 1), range(y, y + 1))
+                     for x, y in changed if x in columns and y in rows]
+            areas += [
+                (range(max(xs.start, columns.start),
+                       min(xs.stop, columns.stop)),
+                 range(max(ys.start, rows.start), min(ys.stop, rows.stop)))
+                for xs, ys in self.exposed
+            ]
+        self.exposed = []
+
+        rects = [self.chunk_cache.blit(xs, ys, self.world_surface,
+                                       self.offset)
+                 for xs, ys in areas if len(xs) and len(ys)]
+
+        if self.DEBUG:
+            for x, y in changed:
+                if x in columns and y in rows:
+                    self.mark_rect((x, y, x + 1, y + 1))
 
-        draw_rect = rect.SDL_Rect(0, 0, 0, 0)
-        h = 0
-        for y in self.world.in_height(self.offset.y,
-                                      self.offset.y + self.blocks_in_height):
-            w = 0
-            for x in self.world.in_width(self.offset.x,
-                                         self.offset.x + self.blocks_in_width):
-                if not self.world[x][y].dirty and not self.dirty:
-                    w += 1
-                    continue
-
-                draw_rect.x = w * self.BLOCK_SIZE
-                draw_rect.y = h * self.BLOCK_SIZE
-
-                sdl2.surface.SDL_BlitSurface(
-                    self.world[x][y].sprite.surface,
-                    None, self.c_surface, draw_rect
-                )
-
-                if self.world[x][y].pickable:
-                    draw_rect.x += self.BLOCK_SIZE // 5
-                    draw_rect.y += self.BLOCK_SIZE // 5
-
-                    sdl2.surface.SDL_BlitSurface(
-                        self.world[x][y].drop_sprite.surface,
-                        rect.SDL_Rect(
-                            0, 0,
-                            self.BLOCK_SIZE // 2, self.BLOCK_SIZE // 2
-                        ),
-                        self.c_surface, draw_rect
-                    )
+        margin = self.chunk_cache.chunk_size
+        self.chunk_cache.prefetch(
+            range(columns.start - margin, columns.stop + margin),
+            range(rows.start - margin, rows.stop + margin))
+        return rects
 
-                if self.world[x][y].dirty and self.DEBUG:
-                    self.mark_rect((x, y, x + 1, y + 1))
+    def draw(self):
+        """Draw what changed in every layer and put the screen together
+        where it did. Returns the screen rects drawn, None when the whole
+        screen changed."""
+        scrolled = self.scroll_view()
+        full = self.dirty
+        for drawn in self.profiler.measure('update_screen',
+                                           self.update_screen):
+            self.compositor.damage(drawn)
+        if full or scrolled:
+            self.compositor.damage()
+
+        self.profiler.measure('draw_entities', self.draw_entities)
+        self.profiler.measure('draw_player', self.draw_player)
+        self.draw_hud()
+        self.dirty = False
 
-                self.world[x][y].dirty = False
+        rects = self.compositor.composite()
+        return None if full or scrolled else rects
+
+    def entity_surface(self, kind, data):
+        if kind == KIND_IDS['mob']:
+            return self.player.sprite.surface
+        elif kind == KIND_IDS['item']:
+            return UiHelper.sprites[WorldObject.sprite_index[data]].surface
+        return self.projectile_surface
+
+    def draw_entities(self):
+        """Put the entities in view on the entity layer, damaging the
+        screen where they were and are now when they moved"""
+        entities = self.entities
+        if not len(entities) and not self.drawn_entities:
+            return
+        drawn = set()  # (kind, data, x, y, w, h) on screen
+        for index in entities.query(self.offset.x, self.offset.y,
+                                    self.blocks_in_width,
+                                    self.blocks_in_height):
+            x, y, width, height = entities.box(index)
+            drawn.add((
+                entities.kind[index], entities.data[index],
+                int((x - self.offset.x) * self.BLOCK_SIZE),
+                int((y - self.offset.y) * self.BLOCK_SIZE),
+                int(width * self.BLOCK_SIZE), int(height * self.BLOCK_SIZE)))
+        if drawn == self.drawn_entities:
+            return
 
-                w += 1
-            h += 1
+        for kind, data, x, y, w, h in drawn ^ self.drawn_entities:
+            self.compositor.damage(rect.SDL_Rect(x, y, w, h))
+        self.drawn_entities = drawn
+        self.entity_layer.sprites = [
+            (self.entity_surface(kind, data), rect.SDL_Rect(x, y, w, h))
+            for kind, data, x, y, w, h in sorted(drawn)]
 
-    def draw(self):
-        if not self.dirty and not self.player.dirty:
+    def draw_player(self):
+        x, y = map(int, self.world_to_screen(*self.player.position.pos))
+        layer = self.player_layer
+        if (x, y) == (layer.x, layer.y) and not self.player.dirty:
             return
 
-        self.update_screen()
-        self.draw_player()
+        self.compositor.move(layer, x, y, rect.SDL_Rect(
+            x, y,
+            self.player.size.x * self.BLOCK_SIZE,
+            self.player.size.y * self.BLOCK_SIZE
+        ))
+        self.player.dirty = False
 
-        self.dirty = False
+    def draw_hud(self):
+        inventory = self.player.inventory
+        if not inventory.dirty:
+            return
 
-    def draw_player(self):
-        screen_pos = list(
-            map(int, self.world_to_screen(*self.player.position.pos))
-        )
+        inventory.update()
+        x = self.WIDTH // 2 - inventory.width // 2
+        inventory.draw(self.hud_surface, x, 0)
+        self.compositor.move(self.hud_layer, 0, 0, rect.SDL_Rect(
+            x, 0, inventory.width, inventory.height))
+
+    def draw_profile(self):
+        """Show the profiler stats in the bottom left corner when DEBUG,
+        hide them otherwise"""
+        if not self.DEBUG:
+            self.compositor.move(self.profile_layer, 0, 0,
+                                 rect.SDL_Rect(0, 0, 0, 0))
+            return
 
-        self.player.draw(self.c_surface, *screen_pos)
+        surface = self.profile_surface
+        sdl2.surface.SDL_FillRect(surface, None, 0)
+        stats = self.profiler.stats()
+        lines = [('ms', 'min', 'avg', 'p95', 'p99')] + [
+            (phase,) + tuple('{:.2f}'.format(stats[phase][key])
+                             for key in ('min', 'avg', 'p95', 'p99'))
+            for phase in self.PROFILE_PHASES + ('total',) +
+            self.PROFILE_COUNTERS
+        ]
+        for row, line in enumerate(lines):
+            for column, text in enumerate(line):
+                sprite = self.profile_text.get(text, self.font_manager)
+                sdl2.surface.SDL_BlitSurface(
+                    sprite.surface, None, surface, rect.SDL_Rect(
+                        4 + 130 * (column > 0) + 60 * max(column - 1, 0),
+                        2 + 20 * row, 0, 0))
 
-        was_dirty = self.player.inventory.dirty
-        self.player.inventory.update()
-        was_dirty = was_dirty or self.player.inventory.dirty
-        screen_pos = (
-            self.WIDTH // 2 - self.player.inventory.width // 2,
-            0
-        )
+        height = surface.contents.h
+        self.compositor.move(
+            self.profile_layer, 0, self.HEIGHT - height,
+            rect.SDL_Rect(0, self.HEIGHT - height, surface.contents.w,
+                          height))
 
-        self.player.inventory.draw(self.c_surface, *screen_pos)
-        if was_dirty:
-            from_pos = list(self.screen_to_world(*screen_pos))
-            from_pos[0] -= 2
-            to_pos = list(self.screen_to_world(
-                screen_pos[0] + self.player.inventory.width,
-                self.player.inventory.height
-            ))
-            to_pos[0] += 1
-            for x in self.world.in_width(from_pos[0], to_pos[0]):
-                for y in self.world.in_height(from_pos[1], to_pos[1]):
-                    self.world[x][y].dirty = True
-
-    def focus_player(self):
+    def focus_player(self, snap=False):
         no_move_rect = (
             self.offset.x + self.move_padding[0],
             self.offset.y + self.move_padding[1],
@@ -223,15 +441,58 @@ class PyCraft():
         )
 
         if not point_in_rect(self.player.position.pos, no_move_rect):
-            self.dirty = True
-
-            self.offset[0] = bind_in_range(
+            self.target[0] = bind_in_range(
                 self.player.position.x - self.blocks_in_width // 2,
                 0, self.world.width - self.blocks_in_width)
 
-            self.offset[1] = bind_in_range(
+            self.target[1] = bind_in_range(
                 self.player.position.y - self.blocks_in_height // 2,
-                0, self.world.width - self.blocks_in_height)
+                0, self.world.height - self.blocks_in_height)
+
+        view = (self.blocks_in_width, self.blocks_in_height)
+        for axis in (0, 1):
+            delta = self.target[axis] - self.offset[axis]
+            # a part of the way every step, at least a block, jumping
+            # straight there when it is more than a screen away
+            if self.SMOOTH_SCROLL and not snap and abs(delta) < view[axis]:
+                delta = signof(delta) * ceil(abs(delta) / self.SCROLL_EASE)
+            self.offset[axis] += delta
+
+    def scroll_view(self):
+        """Move the world layer along with the view offset instead of
+        drawing it all again, leaving the strips that came into view to
+        update_screen. Returns whether the view moved that way."""
+        drawn = self.drawn_offset
+        dx, dy = self.offset.x - drawn.x, self.offset.y - drawn.y
+        if self.dirty or abs(dx) >= self.blocks_in_width or\
+                abs(dy) >= self.blocks_in_height:
+            self.dirty = True
+            drawn.pos = list(self.offset.pos)
+            return False
+        if not dx and not dy:
+            return False
+
+        size = self.BLOCK_SIZE
+        kept = rect.SDL_Rect(max(dx, 0) * size, max(dy, 0) * size,
+                             (self.blocks_in_width - abs(dx)) * size,
+                             (self.blocks_in_height - abs(dy)) * size)
+        sdl2.surface.SDL_BlitSurface(self.world_surface, kept,
+                                     self.scroll_surface, kept)
+        sdl2.surface.SDL_BlitSurface(
+            self.scroll_surface, kept, self.world_surface,
+            rect.SDL_Rect(max(-dx, 0) * size, max(-dy, 0) * size, 0, 0))
+
+        right = self.offset.x + self.blocks_in_width
+        bottom = self.offset.y + self.blocks_in_height
+        columns = range(right - dx, right) if dx > 0 else\
+            range(self.offset.x, self.offset.x - dx)
+        rows = range(bottom - dy, bottom) if dy > 0 else\
+            range(self.offset.y, self.offset.y - dy)
+        self.exposed.append((columns, range(self.offset.y, bottom)))
+        self.exposed.append((range(self.offset.x, right), rows))
+
+        drawn.pos = list(self.offset.pos)
+        return True
 
     def events(self):
         for event in sdl2.ext.get_events():
@@ -245,6 +506,11 @@ class PyCraft():
                     self.player.move(1)
                 elif event.key.keysym.sym in (sdl2.SDLK_SPACE, sdl2.SDLK_w):
                     self.player.jump()
+                elif event.key.keysym.sym == sdl2.SDLK_F3:
+                    self.DEBUG = not self.DEBUG
+                    # drop the cell marks, or bring them back
+                    self.dirty = True
+                    self.draw_profile()
             elif event.type == sdl2.SDL_MOUSEBUTTONDOWN:
                 x, y = self.screen_to_world(event.button.x, event.button.y)
                 self.player.action(x, y)
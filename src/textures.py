@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+import ctypes
+import os
+import struct
+
+import sdl2
+import sdl2.ext
+
+# magic, pixel format, width, height, size and mtime of the source image
+CACHE_HEADER = struct.Struct('<4sIIIqq')
+CACHE_MAGIC = b'PXC1'
+
+# what images with an alpha channel are converted to instead of the screen
+# format, same channel layout as the usual XRGB8888 screens
+ALPHA_FORMAT = sdl2.pixels.SDL_PIXELFORMAT_ARGB8888
+
+
+class TextureLoader:
+
+    """Loads the textures of the block types, each image once and
+    converted to the pixel format of the screen so blitting them needs no
+    conversion. Images with an alpha channel are converted to ALPHA_FORMAT
+    instead to keep it, types without an image get a block of their color.
+
+    With workers images are decoded in a thread pool. With cache_dir the
+    converted pixels are kept there, and used instead of the image for as
+    long as its size and modification time stay the same.
+    """
+
+    def __init__(self, resources, pixel_format, block_size, workers=None,
+                 cache_dir=None):
+        self.resources = resources
+        self.pixel_format = pixel_format
+        self.block_size = block_size
+        self.workers = workers
+        self.cache_dir = cache_dir
+
+    def load(self, types):
+        """SDL_Surface pointers of every texture key of types"""
+        images = [key for block in types if block.image is not None
+                  for key in block.keys()]
+        if self.workers:
+            with ThreadPoolExecutor(self.workers) as pool:
+                surfaces = dict(zip(images, pool.map(self.image, images)))
+        else:
+            surfaces = {key: self.image(key) for key in images}
+
+        for block in types:
+            if block.image is None:
+                for key in block.keys():
+                    surfaces[key] = self.color(block.color)
+        return surfaces
+
+    def color(self, color):
+        surface = sdl2.surface.SDL_CreateRGBSurfaceWithFormat(
+            0, self.block_size, self.block_size, 32, self.pixel_format)
+        sdl2.surface.SDL_FillRect(surface, None, sdl2.pixels.SDL_MapRGB(
+            surface.contents.format, *color))
+        return surface
+
+    def image(self, key):
+        file_path = self.resources.get_path(key)
+        stat = os.stat(file_path)
+        source = (stat.st_size, stat.st_mtime_ns)
+
+        surface = self._cached(key, source)
+        if surface is not None:
+            return surface
+
+        image = sdl2.ext.load_image(file_path)
+        pixel_format = ALPHA_FORMAT if image.format.contents.Amask else\
+            self.pixel_format
+        surface = sdl2.surface.SDL_ConvertSurfaceFormat(
+            ctypes.byref(image), pixel_format, 0)
+        sdl2.surface.SDL_FreeSurface(ctypes.byref(image))
+        if not surface:
+            raise sdl2.ext.SDLError()
+
+        self._cache(key, source, surface)
+        return surface
+
+    def _cache_path(self, key):
+        return path.join(self.cache_dir, key.replace(os.sep, '_') + '.px')
+
+    def _cached(self, key, source):
+        """Surface of the cached pixels of key, None if they are missing
+        or stale"""
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_path(key), 'rb') as cache:
+                header = cache.read(CACHE_HEADER.size)
+                pixels = cache.read()
+        except OSError:
+            return None
+
+        if len(header) != CACHE_HEADER.size:
+            return None
+        magic, pixel_format, width, height, *cached =\
+            CACHE_HEADER.unpack(header)
+        if magic != CACHE_MAGIC or tuple(cached) != source or\
+                pixel_format not in (self.pixel_format, ALPHA_FORMAT) or\
+                len(pixels) != width * height * 4:
+            return None
+
+        surface = sdl2.surface.SDL_CreateRGBSurfaceWithFormat(
+            0, width, height, 32, pixel_format)
+        contents = surface.contents
+        row = width * 4
+        for y in range(height):
+            ctypes.memmove(contents.pixels + y * contents.pitch,
+                           pixels[y * row:(y + 1) * row], row)
+        return surface
+
+    def _cache(self, key, source, surface):
+        if self.cache_dir is None:
+            return
+        contents = surface.contents
+        row = contents.w * 4
+        pixels = b''.join(
+            ctypes.string_at(contents.pixels + y * contents.pitch, row)
+            for y in range(contents.h))
+
+        # written aside and moved in place, so a reader never sees half
+        cache_path = self._cache_path(key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(cache_path + '.tmp', 'wb') as cache:
+            cache.write(CACHE_HEADER.pack(
+                CACHE_MAGIC, contents.format.contents.format, contents.w,
+                contents.h, *source))
+            cache.write(pixels)
+        os.replace(cache_path + '.tmp', cache_path)
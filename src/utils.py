@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import math
 
 import sdl2
@@ -10,7 +11,39 @@ class UiHelper:
     pass
 
 
+class TextCache:
+
+    """Sprites of rendered text keyed by the text and how it is rendered.
+    The least recently used are dropped past max_size, which frees their
+    surfaces. surfaces counts the texts rendered so far."""
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.surfaces = 0
+        self._sprites = OrderedDict()
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def get(self, text, font_manager=None, **kwargs):
+        font_manager = font_manager or UiHelper.font_manager
+        key = (text, id(font_manager), tuple(sorted(kwargs.items())))
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            return sprite
+
+        sprite = self._sprites[key] = UiHelper.sprite_factory.from_text(
+            text, fontmanager=font_manager, **kwargs)
+        self.surfaces += 1
+        if len(self._sprites) > self.max_size:
+            self._sprites.popitem(last=False)
+        return sprite
+
+
 class Drawable:
+    __slots__ = ('dirty', 'dirty_rect', 'sprite')
+
     def __init__(self, sprite):
         self.dirty = True
         self.dirty_rect = (0, 0, 0, 0)
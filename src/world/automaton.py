@@ -0,0 +1,142 @@
+from operator import itemgetter
+from time import perf_counter
+
+from .world_file import CHUNK_SIZE
+
+# values of "physics" in world_types.json
+GRANULAR = 'granular'
+LIQUID = 'liquid'
+
+
+class Automaton:
+
+    """Falling sand and flowing liquids, the cells of types whose physics
+    is GRANULAR or LIQUID.
+
+    Only active cells are looked at, cells that moved or had a neighbour
+    change. They are kept in a set per chunk_size x chunk_size chunk, a
+    chunk without active cells left is asleep and costs nothing. step
+    moves every active cell by at most one cell, the bottom row first so
+    a falling pile comes down together, and a column of cells of the same
+    type falls as one by moving its top cell to the bottom. Granular cells
+    fall into any cell that is not solid and slide off slopes, liquid
+    cells fall into empty cells and flow sideways towards a drop at most
+    spread cells away. Cells that can not move are dropped from the active
+    set.
+
+    physics and solid are the tables of WorldObject by type id.
+    """
+
+    spread = 8
+
+    def __init__(self, world, physics, solid, chunk_size=CHUNK_SIZE):
+        self.world = world
+        self.physics = physics
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.steps = 0
+
+        # type ids cells of each physics move into
+        self._into = {
+            GRANULAR: bytes(not solid[type_id] and kind != GRANULAR
+                            for type_id, kind in enumerate(physics)),
+            LIQUID: bytes(not solid[type_id] and kind is None
+                          for type_id, kind in enumerate(physics)),
+        }
+
+    def __len__(self):
+        return sum(len(active) for active in self.chunks.values())
+
+    @property
+    def settled(self):
+        """Whether every chunk sleeps"""
+        return not self.chunks
+
+    def activate(self, x, y):
+        """Look at the cell on the next step if it can move at all"""
+        if self.world.valid(x, y) and\
+                self.physics[self.world.tile(x, y)] is not None:
+            key = (x // self.chunk_size, y // self.chunk_size)
+            self.chunks.setdefault(key, set()).add((x, y))
+
+    def wake(self, x, y):
+        """Activate a changed cell and the cells that might move into it"""
+        world, physics, chunks = self.world, self.physics, self.chunks
+        size = self.chunk_size
+        for cx, cy in ((x, y), (x - 1, y), (x + 1, y), (x - 1, y - 1),
+                       (x, y - 1), (x + 1, y - 1)):
+            if world.valid(cx, cy) and\
+                    physics[world.tile(cx, cy)] is not None:
+                chunks.setdefault((cx // size, cy // size), set())\
+                    .add((cx, cy))
+
+    def sleep(self, key):
+        """Forget the active cells of chunk key, like when it is unloaded"""
+        self.chunks.pop(key, None)
+
+    def step(self, budget=None):
+        """Move the active cells, for at most budget seconds. Cells not
+        reached stay active for the next step. Returns how many moved."""
+        if not self.chunks:
+            return 0
+        start = perf_counter()
+        cells = sorted((cell for active in self.chunks.values()
+                        for cell in active), key=itemgetter(1), reverse=True)
+        self.chunks = {}
+
+        tile, physics = self.world.tile, self.physics
+        moved = set()
+        for index, (x, y) in enumerate(cells):
+            if budget is not None and not index & 63 and\
+                    perf_counter() - start > budget:
+                for cell in cells[index:]:
+                    self.activate(*cell)
+                break
+            if (x, y) in moved:
+                continue
+            kind = physics[tile(x, y)]
+            if kind is None:
+                continue
+            target = self._target(x, y, kind)
+            if target is None:
+                continue
+            if target[0] == x:
+                # the cells of the type above fall along
+                type_id, top = tile(x, y), y
+                while top > 0 and tile(x, top - 1) == type_id:
+                    top -= 1
+                moved.update((x, row) for row in range(top + 1, y + 2))
+                y = top
+            else:
+                moved.add(target)
+            self.world.swap(x, y, *target)
+            self.wake(x, y)
+            self.activate(*target)
+
+        self.steps += 1
+        return len(moved)
+
+    def _target(self, x, y, kind):
+        """Cell the cell at (x, y) moves to, None if it stays"""
+        tile, valid, into = self.world.tile, self.world.valid,\
+            self._into[kind]
+
+        def free(x, y):
+            return valid(x, y) and into[tile(x, y)]
+
+        if free(x, y + 1):
+            return x, y + 1
+        # the side tried first alternates, and stays the same for a cell
+        # that keeps moving sideways
+        first = 1 if (x + self.steps) & 1 else -1
+        for dx in (first, -first):
+            if free(x + dx, y) and free(x + dx, y + 1):
+                return x + dx, y + 1
+        if kind == LIQUID:
+            for dx in (first, -first):
+                for distance in range(1, self.spread + 1):
+                    if not free(x + dx * distance, y):
+                        break
+                    if free(x + dx * distance, y + 1):
+                        return x + dx, y
+        return None
@@ -0,0 +1,60 @@
+from collections import deque
+from heapq import heappush, heappop
+from time import perf_counter
+
+
+class BlockUpdates:
+
+    """Queue of pending block updates.
+
+    Updates are hashable tuples understood by the world processing them.
+    Immediate ones run in the order they were scheduled and are only
+    queued once at a time, delayed ones wait in a heap ordered by the time
+    in milliseconds they are due at. Whatever does not fit in a tick is
+    left for the next.
+    """
+
+    def __init__(self):
+        self.time = 0
+        self._queue = deque()
+        self._queued = set()
+        self._delayed = []
+
+    def __len__(self):
+        return len(self._queue) + len(self._delayed)
+
+    @property
+    def queued(self):
+        """Number of updates to run now, not counting delayed ones"""
+        return len(self._queue)
+
+    def schedule(self, update, delay=0):
+        """Queue an update to run now, or delay milliseconds from now"""
+        if delay > 0:
+            heappush(self._delayed, (self.time + delay, update))
+        elif update not in self._queued:
+            self._queued.add(update)
+            self._queue.append(update)
+
+    def advance(self, dt):
+        """Move dt milliseconds forward, queueing the delayed updates that
+        are due by then"""
+        self.time += dt
+        while self._delayed and self._delayed[0][0] <= self.time:
+            self.schedule(heappop(self._delayed)[1])
+
+    def due(self, max_updates=None, budget=None):
+        """Yield queued updates until max_updates were yielded or budget
+        seconds have passed, None for no limit"""
+        deadline = None if budget is None else perf_counter() + budget
+        count = 0
+        while self._queue:
+            if max_updates is not None and count >= max_updates:
+                return
+            if deadline is not None and perf_counter() >= deadline:
+                return
+
+            update = self._queue.popleft()
+            self._queued.discard(update)
+            count += 1
+            yield update
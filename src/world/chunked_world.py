@@ -0,0 +1,354 @@
+from os import path
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from random import randrange
+import os
+import shutil
+import tempfile
+import weakref
+
+from .world import World, WorldObject, CellTable
+from .world_generator import WorldGenerator, generate_columns
+from .world_file import WorldFile, CHUNK_SIZE, chunk_tiles, split_cells,\
+    pack_chunk, unpack_chunk
+
+REGION_CHUNKS = WorldGenerator.region_width // CHUNK_SIZE
+
+
+class Chunk:
+
+    """CHUNK_SIZE x CHUNK_SIZE tiles stored column by column"""
+
+    __slots__ = ('tiles', 'modified')
+
+    def __init__(self, tiles, modified=True):
+        self.tiles = tiles
+        self.modified = modified
+
+
+class ChunkedWorld(World):
+
+    """World of fixed size chunks that are generated the first time they
+    are touched and kept in a LRU cache bound by memory_budget bytes of
+    tiles. Evicted chunks are spilled to spill_dir as WorldFile chunk
+    records, with the drops and health of their cells, and loaded back
+    when touched again.
+    Chunks nobody changed are dropped instead, generating them again from
+    the seed gives the same tiles. A world loaded from a WorldFile reads
+    the chunks saved in it from there before generating anything. Falling
+    and flowing cells sleep while their chunk is away and carry on once
+    it is back.
+
+    Chunks are generated a generator region (REGION_CHUNKS columns of
+    chunks spanning the whole world height) at a time. The width is only
+    there to keep the World interface, it is large enough to never be
+    reached.
+    """
+
+    def __init__(self, height, width=2 ** 30, memory_budget=16 * 2 ** 20,
+                 spill_dir=None, seed=None, world_file=None):
+        self.width = width
+        self.height = height
+        self.seed = randrange(2 ** 32) if seed is None else seed
+        self.world_file = world_file
+
+        self.rows = -(-height // CHUNK_SIZE)
+        self.max_chunks = memory_budget // (CHUNK_SIZE * CHUNK_SIZE)
+        if self.max_chunks < 2 * REGION_CHUNKS * self.rows:
+            raise ValueError('memory_budget too small for world height')
+
+        if spill_dir is None:
+            spill_dir = tempfile.mkdtemp(prefix='py-craft-')
+            weakref.finalize(self, shutil.rmtree, spill_dir, True)
+        self.spill_dir = spill_dir
+
+        self._chunks = OrderedDict()
+        self._surfaces = {}
+        self._init_state()
+
+    @classmethod
+    def load(cls, file_path, **kwargs):
+        world_file = WorldFile(file_path,
+                               [block.name for block in WorldObject.types])
+        if world_file.chunk_size != CHUNK_SIZE:
+            raise ValueError('{} has {} tile chunks instead of {}'.format(
+                file_path, world_file.chunk_size, CHUNK_SIZE))
+
+        return cls(world_file.height, world_file.width, seed=world_file.seed,
+                   world_file=world_file, **kwargs)
+
+    def _chunk(self, cx, cy):
+        key = (cx, cy)
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+            return chunk
+
+        if path.exists(self._spill_path(key)):
+            self._load(key)
+        elif self.world_file is not None and key in self.world_file:
+            self._load_saved(key)
+        else:
+            self._generate(cx // REGION_CHUNKS)
+        return self._chunks[key]
+
+    def _known(self, key):
+        return key in self._chunks or path.exists(self._spill_path(key)) or\
+            self.world_file is not None and key in self.world_file
+
+    def _insert(self, key, chunk):
+        self._chunks[key] = chunk
+        while len(self._chunks) > self.max_chunks:
+            self._evict(*self._chunks.popitem(last=False))
+
+    def _region_columns(self, region):
+        low = region * REGION_CHUNKS * CHUNK_SIZE
+        return low, low + REGION_CHUNKS * CHUNK_SIZE
+
+    def _generate(self, region):
+        self._store(region, generate_columns(
+            self.seed, *self._region_columns(region), self.height))
+
+    def pregenerate(self, x, radius, workers=None):
+        """Generate every region within radius columns of x with chunks
+        that are neither loaded, spilled nor saved, in a pool of worker
+        processes if workers is given"""
+        regions = [
+            region for region in range(
+                max(x - radius, 0) // (REGION_CHUNKS * CHUNK_SIZE),
+                (x + radius) // (REGION_CHUNKS * CHUNK_SIZE) + 1)
+            if not all(self._known((cx, cy))
+                       for cx in range(region * REGION_CHUNKS,
+                                       (region + 1) * REGION_CHUNKS)
+                       for cy in range(self.rows))
+        ]
+        if not workers:
+            for region in regions:
+                self._generate(region)
+            return
+
+        with ProcessPoolExecutor(workers, initializer=WorldObject.init,
+                                 initargs=(WorldObject.resource_path,))\
+                as pool:
+            spans = [
+                pool.submit(generate_columns, self.seed,
+                            *self._region_columns(region), self.height)
+                for region in regions
+            ]
+            for region, span in zip(regions, spans):
+                self._store(region, span.result())
+
+    def _store(self, region, tiles):
+        """Split the column major tiles of a region into chunks and insert
+        those that are not known already"""
+        chunks = chunk_tiles(tiles, REGION_CHUNKS * CHUNK_SIZE, self.height,
+                             WorldObject.ids['none'])
+
+        for lcx in range(REGION_CHUNKS):
+            cx = region * REGION_CHUNKS + lcx
+            fresh = True
+            for cy in range(self.rows):
+                key = (cx, cy)
+                if not self._known(key):
+                    self._insert(key, Chunk(chunks[(lcx, cy)], False))
+                    self._wake_chunk(key)
+                else:
+                    fresh = False
+
+            # the generated surface only holds for untouched columns
+            self._surfaces.pop(cx, None)
+            if fresh:
+                self.surface_height(cx * CHUNK_SIZE)
+
+    def _spill_path(self, key):
+        return path.join(self.spill_dir, '{}_{}.chunk'.format(*key))
+
+    def _cells(self, key, table):
+        """Entries of a side table inside chunk key, by chunk local cell"""
+        low_x, low_y = key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE
+        if isinstance(table, CellTable):
+            return {(x - low_x, y - low_y): table[(x, y)]
+                    for x, y in table.in_rect(low_x, low_y,
+                                              CHUNK_SIZE, CHUNK_SIZE)}
+        return {
+            (x - low_x, y - low_y): value for (x, y), value in table.items()
+            if low_x <= x < low_x + CHUNK_SIZE and
+            low_y <= y < low_y + CHUNK_SIZE
+        }
+
+    def _merge(self, key, table, cells):
+        low_x, low_y = key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE
+        for (x, y), value in cells.items():
+            table[(low_x + x, low_y + y)] = value
+
+    def _evict(self, key, chunk):
+        self._surfaces.pop(key[0], None)
+        self.automaton.sleep(key)
+        self.lighting.forget(key)
+
+        low_x, low_y = key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE
+        drops, health, variants = (
+            self._cells(key, table)
+            for table in (self._drops, self._health, self._variants))
+        for table, cells in ((self._drops, drops), (self._health, health),
+                             (self._variants, variants)):
+            for x, y in cells:
+                del table[(low_x + x, low_y + y)]
+
+        self._dirty = set(cell for cell in self._dirty
+                          if not (low_x <= cell[0] < low_x + CHUNK_SIZE and
+                                  low_y <= cell[1] < low_y + CHUNK_SIZE))
+
+        # grass comes back by itself once the chunk is back, like on a
+        # saved one
+        if chunk.modified:
+            with open(self._spill_path(key), 'wb') as spill:
+                spill.write(pack_chunk(chunk.tiles, drops, health))
+
+    def _load(self, key):
+        with open(self._spill_path(key), 'rb') as spill:
+            tiles, drops, health = unpack_chunk(spill.read())
+        self._merge(key, self._drops, drops)
+        self._merge(key, self._health, health)
+        self._insert(key, Chunk(tiles, False))
+        self._wake_chunk(key)
+
+    def _load_saved(self, key):
+        tiles, drops, health = self.world_file.read(key)
+        self._merge(key, self._drops, drops)
+        self._merge(key, self._health, health)
+        self._insert(key, Chunk(tiles, False))
+        self._wake_chunk(key)
+
+    def _wake_chunk(self, key):
+        """Activate the cells of a chunk coming into memory that fall or
+        flow"""
+        self._activate_falling(self._chunks[key].tiles, key[0] * CHUNK_SIZE,
+                               key[1] * CHUNK_SIZE, CHUNK_SIZE)
+
+    def save(self, file_path=None):
+        """Save to file_path, by default the file the world was loaded from
+        or last saved to. Saving back to that file only writes the chunks
+        changed since they were read from it, any other file is written
+        whole.
+        """
+        if file_path is None:
+            file_path = self.world_file.path
+        target, incremental = self._open_save(file_path)
+        if not incremental and self.world_file is not None:
+            self._write(target, (
+                (key, target.record(*self.world_file.read(key)))
+                for key in list(self.world_file.keys())))
+
+        spilled = [name for name in os.listdir(self.spill_dir)
+                   if name.endswith('.chunk')]
+        self._write(target, (
+            self._spilled_record(name) for name in spilled))
+
+        drops = split_cells(self._drops)
+        health = split_cells(self._health)
+        self._write(target, (
+            (key, target.record(
+                chunk.tiles, drops.get(key, {}), health.get(key, {})))
+            for key, chunk in self._chunks.items() if chunk.modified))
+
+        self._close_save(target, file_path, incremental)
+
+        for name in spilled:
+            os.remove(path.join(self.spill_dir, name))
+        for chunk in self._chunks.values():
+            chunk.modified = False
+
+    def _spilled_record(self, name):
+        """Spills already are chunk records"""
+        key = tuple(int(part) for part in name[:-len('.chunk')].split('_'))
+        with open(path.join(self.spill_dir, name), 'rb') as spill:
+            return key, spill.read()
+
+    def resident_chunks(self):
+        return len(self._chunks)
+
+    def _touch(self, x, y):
+        self._chunk(x // CHUNK_SIZE, y // CHUNK_SIZE).modified = True
+
+    def tile(self, x, y):
+        return self._chunk(x // CHUNK_SIZE, y // CHUNK_SIZE).tiles[
+            x % CHUNK_SIZE * CHUNK_SIZE + y % CHUNK_SIZE]
+
+    def is_solid(self, x, y):
+        return WorldObject.solid_table[self.tile(x, y)]
+
+    def set_tile(self, x, y, type_id):
+        chunk = self._chunk(x // CHUNK_SIZE, y // CHUNK_SIZE)
+        index = x % CHUNK_SIZE * CHUNK_SIZE + y % CHUNK_SIZE
+        old = chunk.tiles[index]
+        chunk.tiles[index] = type_id
+        chunk.modified = True
+        self._reset(x, y)
+        if WorldObject.solid_table[old] != WorldObject.solid_table[type_id]:
+            self._set_solid(x, y, WorldObject.solid_table[type_id])
+
+        surface = self._surfaces.get(x // CHUNK_SIZE)
+        if surface is not None:
+            if WorldObject.solid_table[type_id]:
+                if y < surface[x % CHUNK_SIZE]:
+                    surface[x % CHUNK_SIZE] = y
+            elif y == surface[x % CHUNK_SIZE]:
+                self.update_surface(x, y)
+        self.lighting.changed(x, y, old)
+
+    def fill(self, x, low, high, name):
+        for y in self.in_height(low, high):
+            self.set(x, y, name)
+
+    def column_tiles(self, x):
+        cx, start = x // CHUNK_SIZE, x % CHUNK_SIZE * CHUNK_SIZE
+        return b''.join(
+            self._chunk(cx, cy).tiles[start:start + CHUNK_SIZE]
+            for cy in range(self.rows))[:self.height]
+
+    def surface_height(self, x):
+        """Surfaces are kept per column of chunks. Columns coming back into
+        memory get their grass back since variants are not saved."""
+        cx = x // CHUNK_SIZE
+        surface = self._surfaces.get(cx)
+        if surface is None:
+            low = cx * CHUNK_SIZE
+            surface = array('i', (
+                self._scan_surface(col)
+                for col in range(low, low + CHUNK_SIZE)))
+            self._surfaces[cx] = surface
+            for col, top in enumerate(surface, low):
+                self.updates.schedule((col, top, True))
+        return surface[x % CHUNK_SIZE]
+
+    def surface_heights(self, low=0, high=-1):
+        return array('i', (self.surface_height(x)
+                           for x in self.in_width(low, high)))
+
+    def _scan_surface(self, x, low=0):
+        cx, lx = x // CHUNK_SIZE, x % CHUNK_SIZE
+        for cy in range(low // CHUNK_SIZE, self.rows):
+            start = lx * CHUNK_SIZE
+            column = bytes(
+                self._chunk(cx, cy).tiles[start:start + CHUNK_SIZE])
+            found = column.translate(WorldObject.solid_mask).find(
+                1, max(low - cy * CHUNK_SIZE, 0))
+            if found != -1:
+                return min(cy * CHUNK_SIZE + found, self.height)
+        return self.height
+
+    def update_surface(self, x, low=0):
+        self._solid.pop(x, None)
+        self._solid_changes.add(x)
+        top = self._scan_surface(x, low)
+        surface = self._surfaces.get(x // CHUNK_SIZE)
+        if surface is not None:
+            surface[x % CHUNK_SIZE] = top
+
+    def _update(self, x, y, grow):
+        # updates of evicted chunks are dropped rather than loading them
+        if (x // CHUNK_SIZE, y // CHUNK_SIZE) not in self._chunks:
+            return False
+        return super()._update(x, y, grow)
@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+# Boxes are whole cells and collide with the solid cells of a world, checked
+# from its column bitmaps (World.solid_column) a column at a time instead of
+# a cell at a time. Cells outside the world are solid.
+
+# where a swept box ended up and the normal of the faces that stopped it,
+# 0 along an axis it moved freely on
+Contact = namedtuple('Contact', 'x y normal')
+
+
+def solid_rows(world, x, width=1):
+    """Bitmap of the rows with a solid cell in any of columns
+    [x, x + width)"""
+    bits = 0
+    for column in range(x, x + width):
+        bits |= world.solid_column(column)
+    return bits
+
+
+def blocked(world, x, y, width=1, height=1):
+    """Whether any cell of the box is solid"""
+    if y < 0:
+        return True
+    return bool(solid_rows(world, x, width) >> y & ((1 << height) - 1))
+
+
+def sweep(world, x, y, width, height, dx, dy):
+    """Move a width x height box with its top left cell at (x, y) dx
+    cells across and then dy cells down, each way up to the first solid
+    cell in its path. Returns the Contact."""
+    normal_x = normal_y = 0
+
+    if dx:
+        step = 1 if dx > 0 else -1
+        rows = ((1 << height) - 1) << y
+        lead = x + width - 1 if dx > 0 else x
+        for column in range(lead + step, lead + dx + step, step):
+            if world.solid_column(column) & rows:
+                normal_x = -step
+                break
+            x += step
+
+    if dy > 0:
+        below = solid_rows(world, x, width) >> (y + height) & ((1 << dy) - 1)
+        if below:
+            # down to the lowest set bit, the first solid row
+            dy = (below & -below).bit_length() - 1
+            normal_y = -1
+        y += dy
+    elif dy < 0:
+        top = max(y + dy, 0)
+        above = solid_rows(world, x, width) >> top & ((1 << (y - top)) - 1)
+        if above:
+            # up to the highest set bit, the first solid row
+            y = top + above.bit_length()
+            normal_y = 1
+        else:
+            normal_y = 1 if y + dy < 0 else 0
+            y = top
+
+    return Contact(x, y, (normal_x, normal_y))
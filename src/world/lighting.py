@@ -0,0 +1,260 @@
+from collections import deque
+
+from .world_file import CHUNK_SIZE
+
+MAX_LIGHT = 15
+
+
+class Lighting:
+
+    """Light level, 0 to MAX_LIGHT, of every cell. Cells above the surface
+    of their column are lit by the sky, blocks of types with an emission
+    in world_types.json light up by themselves. Cells that are not solid
+    pass light on, a level darker per cell. Solid cells are as bright as
+    their brightest neighbour but only pass on their own emission.
+
+    Levels are kept in a bytearray per chunk_size x chunk_size chunk,
+    column by column. A chunk is computed the first time one of its cells
+    is asked for, from the chunk and the MAX_LIGHT cells around it, which
+    is as far as light reaches.
+
+    After a change to a cell, computed chunks within reach are updated
+    incrementally. A remove pass takes away the light that might have
+    come through the cell, as far as it went. An add pass then spreads
+    light back in from the cells around that area and from the new
+    sources. Cells whose level changed are marked dirty in the world.
+
+    transparent and emission are tables by type id.
+    """
+
+    def __init__(self, world, transparent, emission, chunk_size=CHUNK_SIZE):
+        self.world = world
+        self.transparent = transparent
+        self.emission = emission
+        self.chunk_size = chunk_size
+        self.chunks = {}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def level(self, x, y):
+        size = self.chunk_size
+        key = (x // size, y // size)
+        levels = self.chunks.get(key)
+        if levels is None:
+            levels = self.chunks[key] = self._compute(key)
+        return levels[x % size * size + y % size]
+
+    def forget(self, key):
+        """Drop the levels of chunk key, like when it is unloaded"""
+        self.chunks.pop(key, None)
+
+    def clear(self):
+        self.chunks.clear()
+
+    def _source(self, x, y, type_id):
+        if y < self.world.surface_height(x):
+            return MAX_LIGHT
+        return self.emission[type_id]
+
+    def _compute(self, key):
+        """Levels of a chunk, spreading light through the chunk and the
+        MAX_LIGHT cells around it"""
+        world, size = self.world, self.chunk_size
+        low_x = max(key[0] * size - MAX_LIGHT, 0)
+        high_x = min((key[0] + 1) * size + MAX_LIGHT, world.width)
+        low_y = max(key[1] * size - MAX_LIGHT, 0)
+        high_y = min((key[1] + 1) * size + MAX_LIGHT, world.height)
+        height = high_y - low_y
+
+        # the box around the chunk, column by column like the world
+        tiles = b''.join(world.column_tiles(x)[low_y:high_y]
+                         for x in range(low_x, high_x))
+        clear = tiles.translate(self.transparent)
+        levels = bytearray(len(tiles))
+        queues = [[] for level in range(MAX_LIGHT + 1)]
+
+        skies = [min(max(world.surface_height(x) - low_y, 0), height)
+                 for x in range(low_x, high_x)]
+        for column, sky in enumerate(skies):
+            if not sky:
+                continue
+            start = column * height
+            levels[start:start + sky] = bytes([MAX_LIGHT]) * sky
+            # only the sky cells next to darker ones spread anything
+            lowest = min(skies[max(column - 1, 0):column + 2])
+            queues[MAX_LIGHT].extend(
+                range(start + min(lowest, sky - 1), start + sky))
+
+        if any(self.emission):
+            glow = tiles.translate(self.emission)
+            for index, emission in enumerate(glow):
+                if emission > levels[index]:
+                    levels[index] = emission
+                    queues[emission].append(index)
+
+        for level in range(MAX_LIGHT, 0, -1):
+            for index in queues[level]:
+                if clear[index]:
+                    if levels[index] != level:
+                        continue
+                    out = level
+                else:
+                    out = self.emission[tiles[index]]
+                row = index % height
+                for other in (index - height if index >= height else -1,
+                              index + height if index + height < len(tiles)
+                              else -1,
+                              index - 1 if row else -1,
+                              index + 1 if row + 1 < height else -1):
+                    if other < 0:
+                        continue
+                    passed = out - clear[other]
+                    if levels[other] < passed:
+                        levels[other] = passed
+                        if clear[other] and passed:
+                            queues[passed].append(other)
+
+        chunk = bytearray(size * size)
+        for x in range(max(key[0] * size, low_x),
+                       min((key[0] + 1) * size, high_x)):
+            low = max(key[1] * size, low_y)
+            high = min((key[1] + 1) * size, high_y)
+            start = (x - low_x) * height
+            chunk[x % size * size + low % size:
+                  x % size * size + low % size + high - low] =\
+                levels[start + low - low_y:start + high - low_y]
+        return chunk
+
+    def changed(self, x, y, old):
+        """Update the computed levels after cell (x, y), a block of type
+        id old before, changed"""
+        if not self.chunks:
+            return
+        world = self.world
+        new = world.tile(x, y)
+        transparent, emission = self.transparent, self.emission
+        if transparent[new] == transparent[old] and\
+                emission[new] == emission[old]:
+            return
+
+        # cells of the column that went into or out of the sky
+        lost = gained = range(0)
+        if transparent[new] != transparent[old]:
+            surface = world.surface_height(x)
+            if transparent[new] and surface > y:
+                gained = range(y, surface)
+            elif not transparent[new] and surface == y:
+                below = world.solid_column(x) >> (y + 1)
+                lost = range(y + 1, y + (below & -below).bit_length())
+
+        rows = [y] + [row for cells in (lost, gained) if cells
+                      for row in (cells[0], cells[-1])]
+        if not self._within(x - MAX_LIGHT, x + MAX_LIGHT,
+                            min(rows) - MAX_LIGHT, max(rows) + MAX_LIGHT):
+            return
+
+        before = {}
+        removed = deque()
+        seeds = deque()
+
+        # the old block passed on its level if clear, its emission if not
+        level = self._get(x, y)
+        removed.append((x, y, level if transparent[old] else emission[old]))
+        self._set(x, y, 0, before)
+        for row in lost:
+            removed.append((x, row, self._get(x, row)))
+            self._set(x, row, 0, before)
+        sources = self._remove(removed, seeds, before)
+
+        for cell in sources + [(x, row) for row in gained] + [(x, y)]:
+            source = self._source(*cell, world.tile(*cell))
+            if source > self._get(*cell):
+                self._set(*cell, source, before)
+            seeds.append(cell)
+        seeds.extend(((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)))
+        self._add(seeds, before)
+
+        for (cx, cy), level in before.items():
+            if self._get(cx, cy) != level:
+                world._dirty.add((cx, cy))
+
+    def _within(self, low_x, high_x, low_y, high_y):
+        """Make sure every chunk overlapping the rect is computed if any
+        is, returns whether any is"""
+        size = self.chunk_size
+        keys = [(cx, cy)
+                for cx in range(max(low_x, 0) // size, high_x // size + 1)
+                for cy in range(max(low_y, 0) // size,
+                                min(high_y, self.world.height - 1) // size
+                                + 1)]
+        if not any(key in self.chunks for key in keys):
+            return False
+        for key in keys:
+            if key not in self.chunks and\
+                    key[0] * size < self.world.width:
+                self.chunks[key] = self._compute(key)
+        return True
+
+    def _get(self, x, y):
+        """Level of a cell, None if it is outside the world or its chunk
+        is not computed"""
+        if not self.world.valid(x, y):
+            return None
+        size = self.chunk_size
+        levels = self.chunks.get((x // size, y // size))
+        if levels is None:
+            return None
+        return levels[x % size * size + y % size]
+
+    def _set(self, x, y, level, before):
+        size = self.chunk_size
+        levels = self.chunks[(x // size, y // size)]
+        index = x % size * size + y % size
+        before.setdefault((x, y), levels[index])
+        levels[index] = level
+
+    def _remove(self, removed, seeds, before):
+        """Darken the cells that might have been lit by the removed
+        (x, y, passed) cells, which passed on level passed. Cells around
+        them still lit go in seeds, returns the sources darkened."""
+        tile, transparent = self.world.tile, self.transparent
+        sources = []
+        while removed:
+            x, y, passed = removed.popleft()
+            for other in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                level = self._get(*other)
+                if not level:
+                    continue
+                type_id = tile(*other)
+                if level <= passed - transparent[type_id]:
+                    self._set(*other, 0, before)
+                    removed.append(other + (
+                        level if transparent[type_id] else
+                        self.emission[type_id],))
+                    if self._source(*other, type_id):
+                        sources.append(other)
+                else:
+                    seeds.append(other)
+        return sources
+
+    def _add(self, seeds, before):
+        """Spread light from the seed cells"""
+        tile, transparent = self.world.tile, self.transparent
+        while seeds:
+            x, y = seeds.popleft()
+            level = self._get(x, y)
+            if level is None:
+                continue
+            type_id = tile(x, y)
+            out = level if transparent[type_id] else self.emission[type_id]
+            for other in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                level = self._get(*other)
+                if level is None:
+                    continue
+                type_id = tile(*other)
+                passed = out - transparent[type_id]
+                if level < passed:
+                    self._set(*other, passed, before)
+                    if transparent[type_id]:
+                        seeds.append(other)
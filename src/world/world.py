@@ -1,56 +1,636 @@
 from os import path
+from collections import namedtuple
+from array import array
 import json
+import os
 import random
-from ..utils import ilist, ceil_abs, Drawable, UiHelper
+from ..utils import ceil_abs, Drawable, UiHelper
+from .world_file import WorldFile, CHUNK_SIZE, chunk_tiles, split_cells
+from .block_updates import BlockUpdates
+from .automaton import Automaton
+from .lighting import Lighting, MAX_LIGHT
+
+
+class BlockType(namedtuple('BlockType', [
+        'id', 'name', 'color', 'health', 'solid', 'image', 'images',
+        'physics', 'emission'])):
+
+    """Immutable description of a block compiled from world_types.json.
+    Shared by every cell and WorldObject of that type.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, type_id, item):
+        images = tuple(item['images']) if 'images' in item else None
+        image = item.get('image')
+        if image == '' and images:
+            image = images[0]
+
+        return cls(type_id, item['name'], tuple(item['color']),
+                   item['health'], bool(item['solid']), image, images,
+                   item.get('physics'),
+                   min(item.get('emission', 0), MAX_LIGHT))
+
+    def keys(self):
+        """Texture keys for every image variant of the type"""
+        if self.images:
+            return self.images
+        return (self.image or self.name,)
 
 
 class WorldObject(Drawable):
 
+    __slots__ = ('type', 'health', 'variant', 'pickable')
+
+    types = None
+
     @classmethod
     def init(cls, resource_path):
         objects_file = open(path.join(resource_path, 'world_types.json'))
-        cls.data = dict()
-
-        for item in json.loads(objects_file.read()):
-            cls.data[item['name']] = item
-
+        items = json.loads(objects_file.read())
         objects_file.close()
 
+        cls.resource_path = resource_path
+        cls.items = items
+        cls.types = [BlockType.from_json(type_id, item)
+                     for type_id, item in enumerate(items)]
+        cls.ids = {block.name: block.id for block in cls.types}
+
+        # lookup tables indexed by type id for the hot paths
+        cls.solid_table = bytes(block.solid for block in cls.types)
+        # same as solid_table but usable with bytes.translate
+        cls.solid_mask = cls.solid_table.ljust(256, b'\0')
+        # the other way around, and the light of every type
+        cls.transparent_mask = bytes(not block.solid for block in cls.types)\
+            .ljust(256, b'\0')
+        cls.emission_mask = bytes(block.emission for block in cls.types)\
+            .ljust(256, b'\0')
+        # translates tiles to the binary digits of their solidity
+        cls.solid_digits = bytes(b'01'[block.solid]
+                                 for block in cls.types).ljust(256, b'0')
+        cls.health_table = [block.health for block in cls.types]
+        cls.physics_table = [block.physics for block in cls.types]
+        cls.key_table = [block.keys() for block in cls.types]
+        cls.sprite_keys = []
+        cls.sprite_index = []
+        for keys in cls.key_table:
+            cls.sprite_index.append(len(cls.sprite_keys))
+            cls.sprite_keys.extend(keys)
+
     def __init__(self, object_type):
-        if WorldObject.data is None:
+        if WorldObject.types is None:
             raise RuntimeError('WorldObject not init')
 
         super().__init__(None)
-        for key in WorldObject.data[object_type].keys():
-            setattr(self, key, WorldObject.data[object_type][key])
-            if key == 'image' and self.image == ''\
-                    and 'images' in WorldObject.data[object_type]:
-                self.image = WorldObject.data[object_type]['images'][0]
-
+        self.type = WorldObject.types[WorldObject.ids[object_type]]
+        self.health = self.type.health
+        self.variant = 0
         self.pickable = False
 
+    @property
+    def name(self):
+        return self.type.name
+
+    @property
+    def solid(self):
+        return self.type.solid
+
+    @property
+    def color(self):
+        return self.type.color
+
+    @property
+    def images(self):
+        return self.type.images
+
+    @property
+    def image(self):
+        return self.get_key()
+
+    def has_prop(self, name):
+        return getattr(self.type, name, None) is not None
+
+    def get_key(self):
+        return WorldObject.key_table[self.type.id][self.variant]
+
+    def __eq__(self, other):
+        return self.type.id == other.type.id
+
+
+class Cell:
+
+    """Light view of a single world cell.
+    The cell state lives in the World tile array and side tables.
+    """
+
+    __slots__ = ('world', 'x', 'y')
+
+    def __init__(self, world, x, y):
+        self.world = world
+        self.x = x
+        self.y = y
+
+    @property
+    def type(self):
+        return WorldObject.types[self.world.tile(self.x, self.y)]
+
+    @property
+    def name(self):
+        return self.type.name
+
+    @property
+    def solid(self):
+        return WorldObject.solid_table[self.world.tile(self.x, self.y)]
+
+    @property
+    def color(self):
+        return self.type.color
+
+    @property
+    def images(self):
+        return self.type.images
+
+    @property
+    def image(self):
+        return self.get_key()
+
+    @property
+    def variant(self):
+        return self.world._variants.get((self.x, self.y), 0)
+
+    @property
+    def health(self):
+        return self.world._health.get(
+            (self.x, self.y),
+            WorldObject.health_table[self.world.tile(self.x, self.y)]
+        )
+
+    @property
+    def sprite(self):
+        return UiHelper.sprites[
+            WorldObject.sprite_index[self.world.tile(self.x, self.y)]
+            + self.variant
+        ]
+
+    @property
+    def pickable(self):
+        return (self.x, self.y) in self.world._drops
+
+    @property
+    def drop_name(self):
+        drop = self.world._drops.get((self.x, self.y))
+        return None if drop is None else WorldObject.types[drop].name
+
+    @property
+    def drop(self):
+        drop = self.world._drops.get((self.x, self.y))
+        return None if drop is None else WorldObject.key_table[drop][0]
+
+    @property
+    def drop_sprite(self):
+        return UiHelper.sprites[
+            WorldObject.sprite_index[self.world._drops[(self.x, self.y)]]
+        ]
+
+    @property
+    def dirty(self):
+        return (self.x, self.y) in self.world._dirty
+
+    @dirty.setter
+    def dirty(self, value):
+        if value:
+            self.world._dirty.add((self.x, self.y))
+        else:
+            self.world._dirty.discard((self.x, self.y))
+
     def has_prop(self, name):
-        return name in self.__dict__
+        return getattr(self.type, name, None) is not None
 
     def get_key(self):
-        return self.image if self.has_prop('image') else self.name
+        return WorldObject.key_table[
+            self.world.tile(self.x, self.y)][self.variant]
 
     def __eq__(self, other):
-        return self.name == other.name
+        return self.type.id == other.type.id
+
+
+class Column:
+
+    __slots__ = ('world', 'x')
+
+    def __init__(self, world, x):
+        self.world = world
+        self.x = x
+
+    def __len__(self):
+        return self.world.height
+
+    def __iter__(self):
+        return (Cell(self.world, self.x, y) for y in range(len(self)))
+
+    def __getitem__(self, idx):
+        return Cell(self.world, self.x, self.world.wrap(idx, 'height'))
+
+    def __setitem__(self, idx, world_object):
+        self.world.set(self.x, self.world.wrap(idx, 'height'),
+                       world_object.name)
+
+
+class CellTable(dict):
+
+    """Side table keyed by (x, y) cells that also sorts its cells into
+    buckets of size x size cells, so the ones inside a rect are found
+    without going through all of them, see in_rect."""
+
+    __slots__ = ('size', '_buckets')
+
+    def __init__(self, size=16):
+        super().__init__()
+        self.size = size
+        self._buckets = {}
+
+    def _bucket(self, cell):
+        return (cell[0] // self.size, cell[1] // self.size)
+
+    def __setitem__(self, cell, value):
+        if cell not in self:
+            self._buckets.setdefault(self._bucket(cell), set()).add(cell)
+        super().__setitem__(cell, value)
+
+    def __delitem__(self, cell):
+        super().__delitem__(cell)
+        key = self._bucket(cell)
+        bucket = self._buckets[key]
+        bucket.discard(cell)
+        if not bucket:
+            del self._buckets[key]
+
+    def pop(self, cell, *default):
+        if cell not in self:
+            return super().pop(cell, *default)
+        value = self[cell]
+        del self[cell]
+        return value
+
+    def update(self, *args, **kwargs):
+        for cell, value in dict(*args, **kwargs).items():
+            self[cell] = value
+
+    def setdefault(self, cell, default=None):
+        if cell not in self:
+            self[cell] = default
+        return self[cell]
+
+    def popitem(self):
+        cell = next(reversed(self))
+        return cell, self.pop(cell)
+
+    def clear(self):
+        super().clear()
+        self._buckets.clear()
+
+    def in_rect(self, x, y, width, height):
+        """Cells of the table in the width x height rect with its top left
+        cell at (x, y), ordered by x and then y"""
+        if width <= 0 or height <= 0:
+            return []
+        size = self.size
+        cells = []
+        for bx in range(x // size, (x + width - 1) // size + 1):
+            for by in range(y // size, (y + height - 1) // size + 1):
+                for cell in self._buckets.get((bx, by), ()):
+                    if x <= cell[0] < x + width and y <= cell[1] < y + height:
+                        cells.append(cell)
+        cells.sort()
+        return cells
 
 
 class World:
 
+    """Tiles are stored column by column as type ids in a single bytearray.
+    Per cell state that only few cells have (damage, drops, image variant,
+    dirty flag) lives in sparse side tables keyed by (x, y). Drops are in a
+    CellTable, drops_in finds those in a rect.
+    The topmost solid cell of every column is kept up to date in _surface.
+    Columns collided with are cached as bitmaps of their solid cells in
+    _solid, see solid_column. The columns in which a cell might have
+    changed solidity since the last take_solid_changes collect in
+    _solid_changes. The light of the cells is in lighting, kept up
+    to date by set_tile.
+
+    A world loaded from or saved to a WorldFile keeps it in world_file and
+    the chunks changed since in _modified, so saving to it again only
+    writes those.
+
+    Changes to the world schedule updates of the cells around them in
+    updates, tick runs as many of them as fit in its limits. Grass grows
+    on exposed surface cells grass_delay milliseconds after they were
+    exposed. They also wake the falling and flowing cells around them in
+    automaton, tick moves those for up to automaton_budget seconds.
+    """
+
+    grass_delay = 700
+    updates_per_tick = 256
+    tick_budget = 0.002
+    automaton_budget = 0.006
+    # columns kept in the solidity bitmap cache
+    solid_columns = 4096
+
     def __init__(self, width, height):
-        self._world = ilist([
-            ilist([WorldObject('none') for _ in range(height)])
-            for __ in range(width)
-        ])
-        self.width = len(self._world)
-        self.height = len(self._world[0])
+        self.width = width
+        self.height = height
+        self.seed = None
+        self.world_file = None
+        self._tiles = bytearray([WorldObject.ids['none']]) * (width * height)
+        self._surface = array('i', [height]) * width
+        # None while the world has no file, every chunk is unsaved then
+        self._modified = None
+        self._init_state()
+
+    def _init_state(self):
+        """Side tables, caches, updates, automaton and lighting, whatever
+        the tiles are kept in"""
+        self._health = {}
+        self._drops = CellTable()
+        self._variants = {}
+        self._dirty = set()
+        self._solid = {}
+        self._solid_changes = set()
+
+        self.updates = BlockUpdates()
+        self.automaton = Automaton(self, WorldObject.physics_table,
+                                   WorldObject.solid_table, CHUNK_SIZE)
+        self.lighting = Lighting(self, WorldObject.transparent_mask,
+                                 WorldObject.emission_mask, CHUNK_SIZE)
 
     def __getitem__(self, idx):
-        return self._world[idx]
+        return Column(self, self.wrap(idx, 'width'))
+
+    def __len__(self):
+        return self.width
+
+    def __iter__(self):
+        return (Column(self, x) for x in range(self.width))
+
+    def wrap(self, idx, dimention='width'):
+        idx = int(idx)
+        size = getattr(self, dimention)
+        if idx < 0:
+            idx += size
+        if not 0 <= idx < size:
+            raise IndexError('world index out of range')
+        return idx
+
+    def tile(self, x, y):
+        return self._tiles[x * self.height + y]
+
+    def is_solid(self, x, y):
+        return WorldObject.solid_table[self._tiles[x * self.height + y]]
+
+    def column_tiles(self, x):
+        """Tiles of column x top to bottom"""
+        return bytes(self._tiles[x * self.height:(x + 1) * self.height])
+
+    def solid_column(self, x):
+        """Solidity of column x as an int with bit y set when cell y is
+        solid. Cells past the bottom, and every cell of columns outside the
+        world, count as solid."""
+        bits = self._solid.get(x)
+        if bits is None:
+            if not 0 <= x < self.width:
+                return -1
+            if len(self._solid) >= self.solid_columns:
+                self._solid.clear()
+            digits = self.column_tiles(x).translate(WorldObject.solid_digits)
+            bits = self._solid[x] = int(digits[::-1] or b'0', 2) |\
+                -(1 << self.height)
+        return bits
+
+    def _set_solid(self, x, y, solid):
+        self._solid_changes.add(x)
+        bits = self._solid.get(x)
+        if bits is not None:
+            self._solid[x] = bits | 1 << y if solid else bits & ~(1 << y)
+
+    def set(self, x, y, name):
+        self.set_tile(x, y, WorldObject.ids[name])
+
+    def _touch(self, x, y):
+        """Mark the chunk of a cell changed since the last save"""
+        if self._modified is not None:
+            self._modified.add((x // CHUNK_SIZE, y // CHUNK_SIZE))
+
+    def set_tile(self, x, y, type_id):
+        old = self._tiles[x * self.height + y]
+        self._tiles[x * self.height + y] = type_id
+        self._touch(x, y)
+        self._reset(x, y)
+        if WorldObject.solid_table[old] != WorldObject.solid_table[type_id]:
+            self._set_solid(x, y, WorldObject.solid_table[type_id])
+
+        if WorldObject.solid_table[type_id]:
+            if y < self._surface[x]:
+                self._surface[x] = y
+        elif y == self._surface[x]:
+            self.update_surface(x, y)
+        self.lighting.changed(x, y, old)
+
+    def swap(self, x, y, other_x, other_y):
+        """Exchange the blocks of two cells, drops stay where they are"""
+        first, second = self.tile(x, y), self.tile(other_x, other_y)
+        for cell, type_id in (((x, y), second), ((other_x, other_y), first)):
+            drop = self._drops.get(cell)
+            self.set_tile(*cell, type_id)
+            if drop is not None:
+                self._drops[cell] = drop
+            self._dirty.add(cell)
+
+    def fill(self, x, low, high, name):
+        """Set cells [low, high) of column x to the given type"""
+        low, high = max(low, 0), min(high, self.height)
+        if low >= high:
+            return
+        type_id = WorldObject.ids[name]
+        start = x * self.height
+        self._tiles[start + low:start + high] = bytes([type_id]) * (high - low)
+        if self._modified is not None:
+            self._modified.update(
+                (x // CHUNK_SIZE, cy)
+                for cy in range(low // CHUNK_SIZE,
+                                (high - 1) // CHUNK_SIZE + 1))
+        self._solid.pop(x, None)
+        self._solid_changes.add(x)
+
+        if WorldObject.solid_table[type_id]:
+            if low < self._surface[x]:
+                self._surface[x] = low
+        elif low <= self._surface[x] < high:
+            self.update_surface(x, high)
+
+    def surface_height(self, x):
+        """Height of the topmost solid cell in column x,
+        world height if the column is empty"""
+        return self._surface[x]
+
+    def surface_heights(self, low=0, high=-1):
+        high = self.width if high == -1 else high
+        return memoryview(self._surface).toreadonly()[low:high]
+
+    def update_surface(self, x, low=0):
+        """Rescan column x for its topmost solid cell starting from low.
+        Needed only after writing to the tiles directly.
+        """
+        self._solid.pop(x, None)
+        self._solid_changes.add(x)
+        start = x * self.height
+        top = self._tiles[start + low:start + self.height]\
+            .translate(WorldObject.solid_mask).find(1)
+        self._surface[x] = self.height if top == -1 else low + top
+
+    def update_surfaces(self, low=0, high=-1):
+        for x in self.in_width(low, high):
+            self.update_surface(x)
+
+    def activate_falling(self, low=0, high=-1):
+        """Activate the cells of columns [low, high) that fall or flow.
+        Needed only after writing to the tiles directly."""
+        high = self.width if high == -1 else high
+        self._activate_falling(self._tiles, 0, 0, self.height,
+                               low * self.height, high * self.height)
+
+    def _activate_falling(self, tiles, x, y, height, start=0, end=None):
+        """Activate the cells of tiles[start:end] that fall or flow. tiles
+        are column major, height cells a column, and the first is cell
+        (x, y)."""
+        end = len(tiles) if end is None else end
+        for type_id, kind in enumerate(WorldObject.physics_table):
+            if kind is None:
+                continue
+            found = tiles.find(type_id, start, end)
+            while found != -1:
+                column, row = divmod(found, height)
+                self.automaton.activate(x + column, y + row)
+                found = tiles.find(type_id, found + 1, end)
+
+    def _reset(self, x, y):
+        self._health.pop((x, y), None)
+        self._drops.pop((x, y), None)
+        self._variants.pop((x, y), None)
+
+    @classmethod
+    def load(cls, file_path):
+        """World saved by save, chunks missing from the file are left empty"""
+        world_file = WorldFile(file_path,
+                               [block.name for block in WorldObject.types])
+        world = cls(world_file.width, world_file.height)
+        world.seed = world_file.seed
+        world.world_file = world_file
+        world._modified = set()
+
+        size, height = world_file.chunk_size, world.height
+        empty = bytes([WorldObject.ids['none']]) * (size * size)
+        columns = {}
+        for cx, cy in world_file.keys():
+            columns.setdefault(cx, []).append(cy)
+        for cx, rows in columns.items():
+            # the chunks of the column one after the other, so every world
+            # column is a slice of size tiles out of each
+            chunks = dict.fromkeys(range(max(rows) + 1), empty)
+            for cy in rows:
+                tiles, drops, health = world_file.read((cx, cy))
+                chunks[cy] = tiles
+                for table, cells in ((world._drops, drops),
+                                     (world._health, health)):
+                    for (x, y), value in cells.items():
+                        table[(cx * size + x, cy * size + y)] = value
+            tiles = b''.join(chunks.values())
+
+            for x in world.in_width(cx * size, (cx + 1) * size):
+                column = b''.join([
+                    tiles[start:start + size] for start in
+                    range((x - cx * size) * size, len(tiles), size * size)
+                ])[:height]
+                world._tiles[x * height:x * height + len(column)] = column
+
+        world.update_surfaces()
+        world.schedule_surfaces()
+        # blocks saved while falling carry on
+        world.activate_falling()
+        return world
+
+    def save(self, file_path=None):
+        """Save to file_path, by default world_file. Saving to world_file
+        only writes the chunks changed since it was loaded or saved, any
+        other file is written whole."""
+        if file_path is None:
+            file_path = self.world_file.path
+        target, incremental = self._open_save(file_path)
+
+        drops = split_cells(self._drops)
+        health = split_cells(self._health)
+        if incremental:
+            chunks = {key: self._chunk_tiles(*key) for key in self._modified}
+        else:
+            chunks = chunk_tiles(self._tiles, self.width, self.height,
+                                 WorldObject.ids['none'])
+        self._write(target, (
+            (key, target.record(tiles, drops.get(key, {}),
+                                health.get(key, {})))
+            for key, tiles in chunks.items()))
+
+        self._close_save(target, file_path, incremental)
+        self._modified = set()
+
+    def _chunk_tiles(self, cx, cy):
+        """Tiles of a chunk column by column, padded like chunk_tiles"""
+        tiles = bytearray([WorldObject.ids['none']]) *\
+            (CHUNK_SIZE * CHUNK_SIZE)
+        low = cy * CHUNK_SIZE
+        high = min(low + CHUNK_SIZE, self.height)
+        for x in self.in_width(cx * CHUNK_SIZE, (cx + 1) * CHUNK_SIZE):
+            start = (x - cx * CHUNK_SIZE) * CHUNK_SIZE
+            tiles[start:start + high - low] =\
+                self._tiles[x * self.height + low:x * self.height + high]
+        return tiles
+
+    def _open_save(self, file_path):
+        """WorldFile to save to file_path with, and whether that is
+        world_file, which then only needs the chunks changed since. Any
+        other file is written aside and moved in place by _close_save, so
+        a file that is still mapped is never truncated or replaced."""
+        world_file = self.world_file
+        if world_file is not None and world_file.remap is None and\
+                world_file.chunk_size == CHUNK_SIZE and\
+                path.abspath(file_path) == path.abspath(world_file.path):
+            return world_file, True
+        return WorldFile.create(file_path + '.tmp', WorldObject.items,
+                                self.width, self.height, self.seed), False
+
+    def _close_save(self, target, file_path, incremental):
+        """Put the file written by a save in place as world_file"""
+        if not incremental:
+            target.close()
+            if self.world_file is not None:
+                self.world_file.close()
+            os.replace(target.path, file_path)
+            target = WorldFile(file_path,
+                               [block.name for block in WorldObject.types])
+        self.world_file = target
+
+    @staticmethod
+    def _write(world_file, records, batch=1024):
+        """Write (key, record) pairs a batch at a time, each write rewrites
+        the index and maps the file again"""
+        pending = {}
+        for key, record in records:
+            pending[key] = record
+            if len(pending) == batch:
+                world_file.write(pending)
+                pending = {}
+        if pending:
+            world_file.write(pending)
 
     def in_width(self, low=0, high=-1):
         high = self.width if high == -1 else high
@@ -70,62 +650,112 @@ class World:
         return x >= 0 and x < self.width and y >= 0 and y < self.height
 
     def build(self, x, y, name):
-        self._world[x][y] = WorldObject(name)
-        self._world[x][y].sprite =\
-            UiHelper.texture_map[self._world[x][y].get_key()]
+        top = self.surface_height(x)
+        self.set(x, y, name)
+        self._dirty.add((x, y))
+        self.schedule_around(x, y, top)
 
     def dig(self, x, y):
-        if not self._world[x][y].solid:
+        if not self.is_solid(x, y):
             return
 
-        self._world[x][y].health -= 1
+        health = self._health.get(
+            (x, y), WorldObject.health_table[self.tile(x, y)]) - 1
+        self._health[(x, y)] = health
+        self._variants.pop((x, y), None)
+        self._dirty.add((x, y))
+        self._touch(x, y)
 
-        if self._world[x][y].has_prop('images'):
-            self._world[x][y].sprite =\
-                UiHelper.texture_map[self._world[x][y].images[0]]
-
-        self._world[x][y].dirty = True
-
-        if self._world[x][y].health == 0:
-            old = self._world[x][y]
-
-            self._world[x][y] = WorldObject('air')
-            self._world[x][y].sprite =\
-                UiHelper.texture_map[self._world[x][y].get_key()]
-            self._world[x][y].pickable = True
-
-            if old.has_prop('images'):
-                self._world[x][y].drop_sprite =\
-                    UiHelper.texture_map[old.images[0]]
-                self._world[x][y].drop = old.images[0]
-            else:
-                self._world[x][y].drop = old.get_key()
-                self._world[x][y].drop_sprite = old.sprite
-
-            self._world[x][y].drop_name = old.name
-
-            del old
+        if health == 0:
+            old = self.tile(x, y)
+            top = self.surface_height(x)
+            self.set(x, y, 'air')
+            self._drops[(x, y)] = old
+            self.schedule_around(x, y, top)
 
     def pick(self, x, y):
-        if not self._world[x][y].pickable:
+        drop = self._drops.pop((x, y), None)
+        if drop is None:
             return None
 
-        picked = WorldObject(self._world[x][y].drop_name)
-        picked.sprite = self._world[x][y].drop_sprite
-
-        self._world[x][y].pickable = False
-        self._world[x][y].drop = None
+        self._dirty.add((x, y))
+        self._touch(x, y)
+        picked = WorldObject(WorldObject.types[drop].name)
+        picked.sprite = UiHelper.sprites[WorldObject.sprite_index[drop]]
         return picked
 
-    def tick(self):
-        for w in self.in_width():
-            for h in self.in_height(0, self.height - 1):
-                if self._world[w][h].solid and not self._world[w][h-1].solid\
-                        and self._world[w][h].has_prop('images'):
-    
-                    self._world[w][h].image = self._world[w][h].images[1]
-                    self._world[w][h].sprite =\
-                        UiHelper.texture_map[self._world[w][h].get_key()]
+    def drops_in(self, x, y, width=1, height=1):
+        """Cells holding a drop in the width x height rect with its top
+        left cell at (x, y)"""
+        return self._drops.in_rect(x, y, width, height)
+
+    def take_dirty(self):
+        """Cells changed since the last call"""
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def take_solid_changes(self):
+        """Columns in which a cell might have changed solidity since the
+        last call"""
+        changes, self._solid_changes = self._solid_changes, set()
+        return changes
+
+    def schedule_around(self, x, y, top):
+        """Schedule updates of a changed cell, its neighbours and the old
+        (top) and current surface cells of its column, and wake the cells
+        that might fall into it"""
+        self.automaton.wake(x, y)
+        for cell in ((x, y), (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1),
+                     (x, top), (x, self.surface_height(x))):
+            if self.valid(*cell):
+                self.updates.schedule(cell + (False,))
+
+    def schedule_surfaces(self, low=0, high=-1):
+        """Grow grass on the surface of columns [low, high) right away"""
+        for x in self.in_width(low, high):
+            self.updates.schedule((x, self.surface_height(x), True))
+
+    def _grassy(self, x, y):
+        return y == self.surface_height(x) and y < self.height - 1\
+            and WorldObject.types[self.tile(x, y)].images is not None
+
+    def _update(self, x, y, grow):
+        """Grass the cell if it is exposed and grow is set, otherwise only
+        schedule growing it later. Covered cells lose their grass."""
+        grassy = self._grassy(x, y)
+        grass = self._variants.get((x, y)) == 1
+        if grassy and not grass:
+            if grow:
+                self._variants[(x, y)] = 1
+                self._dirty.add((x, y))
+                return True
+            self.updates.schedule((x, y, True), self.grass_delay)
+        elif grass and not grassy:
+            del self._variants[(x, y)]
+            self._dirty.add((x, y))
+            return True
+        return False
+
+    def tick(self, dt, max_updates=-1, budget=-1):
+        """Advance dt milliseconds and run the updates due, at most
+        max_updates of them or for budget seconds, by default the class
+        limits, and move the falling and flowing cells once. Returns
+        whether any cell changed."""
+        self.updates.advance(dt)
+        changed = self._run(
+            self.updates_per_tick if max_updates == -1 else max_updates,
+            self.tick_budget if budget == -1 else budget)
+        return self.automaton.step(self.automaton_budget) > 0 or changed
+
+    def settle(self):
+        """Run every update that is due, however long it takes"""
+        return self._run(None, None)
+
+    def _run(self, max_updates, budget):
+        changed = False
+        for update in self.updates.due(max_updates, budget):
+            changed = self._update(*update) or changed
+        return changed
 
     def pointed_range(self, low, high, dimention='width'):
         indecies = range(
@@ -0,0 +1,208 @@
+import json
+import mmap
+import struct
+
+CHUNK_SIZE = 32
+NO_DROP = 255
+
+
+def chunk_tiles(tiles, width, height, fill, chunk_size=CHUNK_SIZE):
+    """Split column major world tiles into {(cx, cy): chunk tiles}.
+    Chunks reaching past the world are padded with fill.
+    """
+    rows = -(-height // chunk_size)
+    column = bytearray([fill]) * (rows * chunk_size)
+
+    chunks = {}
+    for x in range(width):
+        start = x * height
+        column[:height] = tiles[start:start + height]
+        for cy in range(rows):
+            chunk = chunks.setdefault((x // chunk_size, cy), bytearray())
+            chunk += column[cy * chunk_size:(cy + 1) * chunk_size]
+
+    for chunk in chunks.values():
+        chunk.extend(bytes([fill]) * (chunk_size * chunk_size - len(chunk)))
+    return chunks
+
+
+def split_cells(table, chunk_size=CHUNK_SIZE):
+    """Group a {(x, y): value} side table into
+    {(cx, cy): {(local x, local y): value}}"""
+    chunks = {}
+    for (x, y), value in table.items():
+        cx, lx = divmod(x, chunk_size)
+        cy, ly = divmod(y, chunk_size)
+        chunks.setdefault((cx, cy), {})[(lx, ly)] = value
+    return chunks
+
+
+def pack_chunk(tiles, drops, health, chunk_size=CHUNK_SIZE):
+    """Chunk record of the tiles of a chunk and its drops and health keyed
+    by chunk local (x, y), see WorldFile"""
+    cells = chunk_size * chunk_size
+    drop_cells = bytearray([NO_DROP]) * cells
+    for (x, y), drop in drops.items():
+        drop_cells[x * chunk_size + y] = drop
+
+    health_cells = memoryview(bytearray(cells * 4)).cast('i')
+    for (x, y), value in health.items():
+        health_cells[x * chunk_size + y] = value
+
+    return bytes(tiles) + bytes(drop_cells) + health_cells.tobytes()
+
+
+def unpack_chunk(data, chunk_size=CHUNK_SIZE):
+    """Tiles, drops and health of the chunk record at the start of data.
+    The tiles are a bytearray of their own, drops and health are dicts of
+    the cells that have any, keyed by chunk local (x, y)."""
+    cells = chunk_size * chunk_size
+    data = memoryview(data)
+    tiles = bytearray(data[:cells])
+
+    drops, health = {}, {}
+    drop_cells = bytes(data[cells:cells * 2])
+    if drop_cells.count(NO_DROP) != cells:
+        for cell, drop in enumerate(drop_cells):
+            if drop != NO_DROP:
+                drops[divmod(cell, chunk_size)] = drop
+
+    health_cells = data[cells * 2:cells * 6]
+    if bytes(health_cells).count(0) != cells * 4:
+        for cell, value in enumerate(health_cells.cast('i')):
+            if value:
+                health[divmod(cell, chunk_size)] = value
+
+    return tiles, drops, health
+
+
+class WorldFile:
+
+    """Versioned binary world save.
+
+    The header holds the world size, seed, chunk size, where the chunk
+    index is and the block type table the tile ids refer to. Every chunk
+    record is fixed layout: chunk_size ** 2 tile ids, as many drop type
+    ids (NO_DROP for none) and as many little endian int32 healths
+    (0 for undamaged cells), all column major. The chunk index
+    ((cx, cy) -> record offset) is kept at the end of the file.
+
+    The file is mapped, so only the pages of the chunks that are read are
+    ever loaded. Nothing keeps a view on the mapping, it is closed before
+    the file is written, see close.
+    """
+
+    MAGIC = b'PYCRAFT\0'
+    VERSION = 1
+    HEADER = struct.Struct('<8sHHIIqQQI')
+    ENTRY = struct.Struct('<IIQ')
+
+    def __init__(self, file_path, names):
+        self.path = file_path
+        self._open(names)
+
+    def _open(self, names):
+        with open(self.path, 'rb') as world_file:
+            self._map = mmap.mmap(world_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        magic, version, self.chunk_size, self.width, self.height, seed,\
+            self.index_offset, count, types_size =\
+            self.HEADER.unpack_from(self._map)
+        if magic != self.MAGIC:
+            raise ValueError('{} is not a world file'.format(self.path))
+        if version != self.VERSION:
+            raise ValueError('unsupported world file version {}'.format(
+                version))
+
+        self.seed = None if seed < 0 else seed
+        self.types = json.loads(
+            bytes(self._map[self.HEADER.size:self.HEADER.size + types_size])
+            .decode())
+        self.cells = self.chunk_size * self.chunk_size
+
+        self.index = {}
+        for cx, cy, offset in self.ENTRY.iter_unpack(
+                self._map[self.index_offset:
+                          self.index_offset + count * self.ENTRY.size]):
+            self.index[(cx, cy)] = offset
+
+        # tile ids of the file to ids of the running game, None if equal
+        file_names = [item['name'] for item in self.types]
+        self.names = names
+        self.remap = None
+        if file_names != names[:len(file_names)]:
+            self.remap = bytes(
+                names.index(name) if name in names else names.index('none')
+                for name in file_names).ljust(256, b'\0')
+
+    @classmethod
+    def create(cls, file_path, types, width, height, seed,
+               chunk_size=CHUNK_SIZE):
+        types = json.dumps(types).encode()
+        data = -(-(cls.HEADER.size + len(types)) // mmap.PAGESIZE) *\
+            mmap.PAGESIZE
+
+        with open(file_path, 'wb') as world_file:
+            world_file.write(cls.HEADER.pack(
+                cls.MAGIC, cls.VERSION, chunk_size, width, height,
+                -1 if seed is None else seed, data, 0, len(types)))
+            world_file.write(types)
+            world_file.truncate(data)
+
+        return cls(file_path, [item['name'] for item in json.loads(types)])
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def close(self):
+        """Unmap the file. A mapped file can not be truncated or replaced
+        on Windows. Only write and keys work until it is opened again."""
+        self._map.close()
+
+    def read(self, key):
+        """Tiles, drops and health of a chunk, see unpack_chunk"""
+        offset = self.index[key]
+        with memoryview(self._map) as view:
+            tiles, drops, health = unpack_chunk(
+                view[offset:offset + self.cells * 6], self.chunk_size)
+        if self.remap is not None:
+            tiles = tiles.translate(self.remap)
+            drops = {cell: self.remap[drop] for cell, drop in drops.items()}
+        return tiles, drops, health
+
+    def record(self, tiles, drops, health):
+        """Pack a chunk record from its tiles and local drops/health"""
+        return pack_chunk(tiles, drops, health, self.chunk_size)
+
+    def write(self, records):
+        """Write {key: record} in place of the old records or after them,
+        then write the index again and map the file anew"""
+        if not self._map.closed:
+            self.close()
+        with open(self.path, 'r+b') as world_file:
+            end = self.index_offset
+            for key, record in records.items():
+                offset = self.index.get(key)
+                if offset is None:
+                    offset = self.index[key] = end
+                    end += len(record)
+                world_file.seek(offset)
+                world_file.write(record)
+
+            world_file.seek(end)
+            for (cx, cy), offset in self.index.items():
+                world_file.write(self.ENTRY.pack(cx, cy, offset))
+            world_file.truncate()
+
+            world_file.seek(0)
+            fields = list(self.HEADER.unpack(
+                world_file.read(self.HEADER.size)))
+            fields[6], fields[7] = end, len(self.index)
+            world_file.seek(0)
+            world_file.write(self.HEADER.pack(*fields))
+
+        self._open(self.names)
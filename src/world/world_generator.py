@@ -1,15 +1,48 @@
-from .world import WorldObject, World
-from random import randint
+from .world import World, WorldObject
+from ..utils import ceil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import namedtuple
+from random import Random, randrange
+import asyncio
+import os
 
 
-def random_chance(chance):
-    return randint(0, 100) < chance * 100
+GenerationEvent = namedtuple('GenerationEvent', 'stage region progress')
+
+
+def limit_slope(heights, slope):
+    """Forward and backward sweep leaving neighbouring heights at most
+    abs(slope) apart. Heights grow downwards, so a positive slope fills
+    the valleys and a negative one cuts the peaks.
+    """
+    heights = list(heights)
+    pick = min if slope > 0 else max
+    for at in range(1, len(heights)):
+        heights[at] = pick(heights[at], heights[at - 1] + slope)
+    for at in range(len(heights) - 2, -1, -1):
+        heights[at] = pick(heights[at], heights[at + 1] + slope)
+    return heights
+
+
+def smooth_heights(heights, max_inclination):
+    """Meet halfway between the filled and the cut heightmap.
+    Both are max_inclination steep at most and so is their mean.
+    """
+    filled = limit_slope(heights, max_inclination)
+    cut = limit_slope(heights, -max_inclination)
+    return [(low + high) // 2 for low, high in zip(filled, cut)]
 
 
 class WorldGenerator:
 
     """Generates world based on some hardcoded criteria.
     Expect many magic numbers.
+
+    All randomness comes from the world seed. Every region of region_width
+    columns draws from its own generator seeded with (seed, stage, region)
+    and every feature only looks at the terrain heightmap before caves, so
+    any range of columns can be generated on its own, see generate_columns.
+    offset is the world column the first generated column stands for.
     """
 
     air_to_ground = 0.45
@@ -17,168 +50,412 @@ class WorldGenerator:
 
     chance_for_cave = 0.05
     chance_for_rocks = 0.3
+    chance_for_sand = 0.04
     cave_length = 20
+    # deepest below the terrain a sand pocket starts
+    sand_depth = 8
 
     max_inclination = 2
+    mountain_width = 20
+    mountain_height = 60
 
-    def __init__(self, width, height):
+    region_width = 128
+
+    def __init__(self, width, height, seed=None, offset=0):
         self.world = World(width, height)
+        self.seed = randrange(2 ** 32) if seed is None else seed
+        self.offset = offset
+        self.world.seed = self.seed
+
+    @classmethod
+    def margin(cls):
+        """How far to the left of a column caves and rock veins reaching
+        into it can start"""
+        return cls.cave_length * 3 + cls.max_inclination
+
+    @classmethod
+    def height_margin(cls):
+        """How far from a column mountains and smoothing can change its
+        terrain height"""
+        return cls.mountain_width // 2 +\
+            cls.mountain_height // cls.max_inclination
 
     def generate(self, callback=None):
-        self._update_callback = callback
+        """Generate the whole world, calling callback with it after every
+        step of stream"""
+        for event in self.stream():
+            if callback is not None:
+                callback(self.world)
+        return self.world
+
+    def stream(self):
+        """Generate the world step by step, yielding a GenerationEvent after
+        every step. Region wide stages report the region they finished,
+        world wide ones None. A 'final' event means the columns of that
+        region (see region_columns) will not change any more. Stop
+        iterating to cancel.
+        """
+        regions = self.regions()
+        steps = 2 + 5 * len(regions)
+        done = 0
+
+        def event(stage, region):
+            nonlocal done
+            done += 1
+            return GenerationEvent(stage, region, done / steps)
+
         self._ground()
-        self._mountains()
+        yield event('ground', None)
+
+        bumps = [0] * self.world.width
+        for region in regions:
+            self._mountains_in(region, bumps)
+            yield event('mountains', region)
+
+        self._raise_mountains(bumps)
         self._smooth_mountains()
-        self._caves()
-        self._rocks()
-        self._indestructible()
-        return self.world
+        yield event('smoothing', None)
+
+        # features only reach max_inclination columns back into the
+        # previous region, which is final once the next one is done
+        for previous, region in zip([None] + regions, regions):
+            self._caves_in(region)
+            yield event('caves', region)
+            self._rocks_in(region)
+            yield event('rocks', region)
+            self._sand_in(region)
+            yield event('sand', region)
+            if previous is not None:
+                self._finish(previous)
+                yield event('final', previous)
+
+        self._finish(regions[-1])
+        yield event('final', regions[-1])
+
+    async def astream(self):
+        """stream for asyncio, giving other tasks a turn after every step"""
+        for event in self.stream():
+            yield event
+            await asyncio.sleep(0)
+
+    def regions(self):
+        first = self.offset // self.region_width
+        last = (self.offset + self.world.width - 1) // self.region_width
+        return list(range(first, last + 1))
+
+    def region_columns(self, region):
+        """World columns of a region, cut to the world"""
+        start = region * self.region_width - self.offset
+        return range(max(start, 0),
+                     min(start + self.region_width, self.world.width))
+
+    def _region(self, stage, region):
+        """Switch self.random to the generator of a region and return all
+        its columns, also those outside of the world that still have to
+        draw their numbers"""
+        self.random = Random('{}:{}:{}'.format(self.seed, stage, region))
+        start = region * self.region_width - self.offset
+        return range(start, start + self.region_width)
+
+    def _chance(self, chance):
+        return self.random.randint(0, 100) < chance * 100
 
     def _rocks_at(self, width, height):
-        for w in self.world.in_width(width, width + randint(2, 5)):
-            size = randint(2, 5)
-            for h in self.world.in_height(height, height + size):
-                if self.world[w][h].solid:
-                    self.world[w][h] = WorldObject('rock')
-
-    def _rocks(self):
-        for width in self.world.in_width():
-            if random_chance(self.chance_for_rocks):
-                height = self.__ground_height(width)
-                height = randint(height, self.world.height)
+        for w in range(width, width + self.random.randint(2, 5)):
+            size = self.random.randint(2, 5)
+            if 0 <= w < self.world.width:
+                self._rock_vein(w, height, height + size)
+
+    def _rock_vein(self, at, low, high):
+        for h in self.world.in_height(low, high):
+            if self.world.is_solid(at, h):
+                self.world.set(at, h, 'rock')
+
+    def _rocks_in(self, region):
+        for width in self._region('rocks', region):
+            if self._chance(self.chance_for_rocks):
+                height = self._ground_height(width)
+                height = self.random.randint(height, self.world.height)
                 self._rocks_at(width, height)
 
+    def _sand_at(self, width, height):
+        for w in range(width, width + self.random.randint(3, 8)):
+            size = self.random.randint(2, 6)
+            if 0 <= w < self.world.width:
+                self._sand_pocket(w, height, height + size)
+
+    def _sand_pocket(self, at, low, high):
+        for h in self.world.in_height(low, high):
+            if self.world.is_solid(at, h):
+                self.world.set(at, h, 'sand')
+
+    def _sand_in(self, region):
+        for width in self._region('sand', region):
+            if self._chance(self.chance_for_sand):
+                height = self._ground_height(width)
+                height = self.random.randint(height + 1,
+                                             height + self.sand_depth)
+                self._sand_at(width, height)
+
     def _hole_at(self, width, height):
         for w in self.world.in_width(width - self.max_inclination,
                                      width + self.max_inclination):
-            self.world[w][height] = WorldObject('air')
+            self.world.set(w, height, 'air')
 
-        for h in self.world.in_height(height - self.max_inclination,
-                                      height + self.max_inclination):
-            self.world[width][h] = WorldObject('air')
+        if 0 <= width < self.world.width:
+            self.world.fill(width, height - self.max_inclination,
+                            height + self.max_inclination, 'air')
 
     def _cave_at(self, width, height):
-        for w in self.world.in_width(
-                width,
-                width + randint(self.cave_length, self.cave_length * 3)):
+        length = self.random.randint(self.cave_length, self.cave_length * 3)
+        for w in range(width, width + length):
             height = min(height, self.world.height - 1)
             height = max(0, height)
             self._hole_at(w, height)
-            height = height + randint(-1, 1)
+            height = height + self.random.randint(-1, 1)
 
-    def _caves(self):
-        for width in self.world.in_width():
-            if random_chance(self.chance_for_cave):
-                height = self.__ground_height(width)
-                height = randint(
+    def _caves_in(self, region):
+        for width in self._region('caves', region):
+            if self._chance(self.chance_for_cave):
+                height = self._ground_height(width)
+                height = self.random.randint(
                     height + self.max_inclination * 2,
                     self.world.height
                 )
                 self._cave_at(width, height)
-                if self._update_callback is not None:
-                    self._update_callback(self.world)
 
     def _ground(self):
+        ground = ceil(self.air_to_ground * self.world.height)
         for width in self.world.in_width():
-            for height in self.world.in_height():
-                if height < self.air_to_ground * self.world.height:
-                    self.world[width][height] = WorldObject('air')
-                else:
-                    self.world[width][height] = WorldObject('ground')
+            self._set_ground_height(width, ground)
 
-    def _indestructible(self):
-        for width in self.world.in_width():
-            self.world[width][self.world.height-1] =\
-                WorldObject('indestructible')
+    def _finish(self, region):
+        columns = self.region_columns(region)
+        self._indestructible(columns.start, columns.stop)
+        self.world.schedule_surfaces(columns.start, columns.stop)
+        # sand left over a cave falls
+        self.world.activate_falling(columns.start, columns.stop)
 
-    def __ground_height(self, at):
+    def _indestructible(self, low, high):
+        for width in range(low, high):
+            self.world.set(width, self.world.height - 1, 'indestructible')
+
+    def _ground_height(self, at):
+        """Terrain height before any caves were dug"""
         if at < 0:
             at = 0
         elif at >= self.world.width:
             at = self.world.width - 1
 
-        for cell in self.world.in_height():
-            if self.world[at][cell].solid:
-                return cell
-        return 0
-
-    def __inclination_diff(self, a, b):
-        return abs(self.__ground_height(a) - self.__ground_height(b))
+        return self.heights[at]
 
-    def __set_ground_height(self, at, height):
-        for h in self.world.in_height():
-            if h < height:
-                self.world[at][h] = WorldObject('air')
-            else:
-                self.world[at][h] = WorldObject('ground')
+    def _set_ground_height(self, at, height):
+        self.world.fill(at, 0, height, 'air')
+        self.world.fill(at, height, self.world.height, 'ground')
 
     def _mountains(self):
-        last_mountain = -1000
-        for col in self.world.in_width():
-            if random_chance(self.chance_for_mountain):
-                self._mountain_at(col)
-                last_mountain = col
-
-    def __smooth_part(self, diff, at):
-        left, right = self.__ground_height(at), self.__ground_height(at + 1)
-
-        if left < right:
-            self.__set_ground_height(at, left + diff // 2)
-            self.__set_ground_height(at, right - diff // 2)
-        else:
-            self.__set_ground_height(at, left - diff // 2)
-            self.__set_ground_height(at, right + diff // 2)
-
-    def __smooth_pass(self, direction=1):
-        has_unsmoothness = False
-        for_range = [
-            range(0, self.world.width - 1),
-            range(self.world.width - 1, 1, -1)
-        ][direction % 2]
-
-        step = [-1, 1][direction % 2]
-
-        for width in for_range:
-            diff = self.__inclination_diff(width, width + step)
-            if diff > self.max_inclination:
-                has_unsmoothness = True
-                self.__smooth_part(diff, width)
-        return has_unsmoothness
+        bumps = [0] * self.world.width
+        for region in self.regions():
+            self._mountains_in(region, bumps)
+        self._raise_mountains(bumps)
+
+    def _mountains_in(self, region, bumps):
+        for col in self._region('mountains', region):
+            if self._chance(self.chance_for_mountain):
+                self._mountain_at(col, bumps)
+
+    def _raise_mountains(self, bumps):
+        ground = ceil(self.air_to_ground * self.world.height)
+        for col, bump in enumerate(bumps):
+            if bump:
+                self._set_ground_height(
+                    col, ground - min(bump, self.mountain_height))
 
     def _smooth_mountains(self):
-        max_passes = 100
-        while self.__smooth_pass(max_passes) and max_passes > 0:
-            if self._update_callback is not None:
-                self._update_callback(self.world)
-            max_passes -= 1
-
-    def _mountain_at(self, at):
-        mountain_width = 20
-        up_slope = [c for c in range(at - mountain_width // 2, at)
-                    if 0 < c < self.world.width]
-        down_slope = [c for c in range(at, at + mountain_width // 2)
-                      if 0 < c < self.world.width]
-
+        heights = list(self.world.surface_heights())
+        self.heights = smooth_heights(heights, self.max_inclination)
+        for col, height in enumerate(self.heights):
+            if height != heights[col]:
+                self._set_ground_height(col, height)
+
+    def _mountain_at(self, at, bumps):
+        """Random walk up and back down again, added on top of whatever
+        other mountains already raised the columns"""
+        up_slope = range(at - self.mountain_width // 2, at)
+        down_slope = range(at, at + self.mountain_width // 2)
+
+        bump = 0
         for col in up_slope:
-            prev_height = self.__ground_height(col - 1)
-            self.__set_ground_height(
-                col,
-                prev_height - randint(
-                    -self.max_inclination // 2,
-                    self.max_inclination
-                )
+            bump += self.random.randint(
+                -self.max_inclination // 2,
+                self.max_inclination
             )
+            if 0 <= col < self.world.width:
+                bumps[col] += max(bump, 0)
 
         for col in down_slope:
-            prev_height = self.__ground_height(col - 1)
-            self.__set_ground_height(
-                col,
-                prev_height + randint(
-                    -self.max_inclination // 2,
-                    self.max_inclination
-                )
+            bump -= self.random.randint(
+                -self.max_inclination // 2,
+                self.max_inclination
             )
+            if 0 <= col < self.world.width:
+                bumps[col] += max(bump, 0)
 
     @staticmethod
-    def generate_world(callback=None, dim=(1000, 300)):
-        return WorldGenerator(*dim).generate(callback)
+    def generate_world(callback=None, dim=(1000, 300), vectorized=False,
+                       seed=None, workers=None):
+        """Generate a whole world. With workers the world is split into
+        spans generated in a pool of that many processes, which gives the
+        same world as generating it in one go.
+        """
+        if workers:
+            return generate_parallel(dim, seed, workers, callback)
+
+        generator = ArrayWorldGenerator if vectorized else WorldGenerator
+        return generator(dim[0], dim[1], seed).generate(callback)
+
+
+class ArrayWorldGenerator(WorldGenerator):
+
+    """Runs the same stages, with the same random draws, as whole slice
+    operations on the World tile array instead of cell by cell writes.
+    Tiles are column major so a column is a contiguous slice and a row is
+    a slice with step equal to the world height.
+    """
+
+    def __init__(self, width, height, seed=None, offset=0):
+        super().__init__(width, height, seed, offset)
+        self.tiles = self.world._tiles
+        self.height = height
+
+        self.air = bytes([WorldObject.ids['air']])
+        self.ground = bytes([WorldObject.ids['ground']])
+        self.air_column = self.air * height
+        self.ground_column = self.ground * height
+
+        # turn solid type ids into rock or sand and leave the rest as is
+        self.to_rock = bytes(
+            WorldObject.ids['rock'] if solid else type_id
+            for type_id, solid in enumerate(WorldObject.solid_mask)
+        )
+        self.to_sand = bytes(
+            WorldObject.ids['sand'] if solid else type_id
+            for type_id, solid in enumerate(WorldObject.solid_mask)
+        )
+
+    def _column(self, at):
+        start = at * self.height
+        return start, start + self.height
+
+    def _ground(self):
+        ground = ceil(self.air_to_ground * self.height)
+        self.tiles[:] = (self.air_column[:ground] +
+                         self.ground_column[ground:]) * self.world.width
+        self.world.update_surfaces()
+
+    def _set_ground_height(self, at, height):
+        height = min(max(height, 0), self.height)
+        start, end = self._column(at)
+        self.tiles[start:end] =\
+            self.air_column[:height] + self.ground_column[height:]
+        self.world.update_surface(at, height)
+
+    def _rock_vein(self, at, low, high):
+        start, end = self._column(at)
+        low, high = start + low, min(start + high, end)
+        self.tiles[low:high] = self.tiles[low:high].translate(self.to_rock)
+
+    def _sand_pocket(self, at, low, high):
+        start, end = self._column(at)
+        low, high = start + low, min(start + high, end)
+        self.tiles[low:high] = self.tiles[low:high].translate(self.to_sand)
+
+    def _hole_at(self, width, height):
+        low = max(width - self.max_inclination, 0)
+        high = min(width + self.max_inclination, self.world.width)
+        if low < high:
+            self.tiles[low * self.height + height:
+                       high * self.height + height:
+                       self.height] = self.air * (high - low)
+            for w in range(low, high):
+                if self.world.surface_height(w) == height:
+                    self.world.update_surface(w, height)
+
+        if not 0 <= width < self.world.width:
+            return
+
+        start, end = self._column(width)
+        low = max(height - self.max_inclination, 0) + start
+        high = min(height + self.max_inclination, self.height) + start
+        if low < high:
+            self.tiles[low:high] = self.air * (high - low)
+            if low <= self.world.surface_height(width) + start < high:
+                self.world.update_surface(width, high - start)
+
+    def _indestructible(self, low, high):
+        bottom = self.height - 1
+        self.tiles[low * self.height + bottom:high * self.height:
+                   self.height] =\
+            bytes([WorldObject.ids['indestructible']]) * (high - low)
+        for w in range(low, high):
+            if self.world.surface_height(w) > bottom:
+                self.world.update_surface(w, bottom)
+
+
+def generate_columns(seed, low, high, height, world_width=None):
+    """Tiles of columns [low, high) exactly as in the whole world generated
+    from seed. world_width is None for worlds without a right edge.
+
+    Caves and rocks reaching into the range start in the regions from
+    margin() columns left of low to high. Their draws depend on the
+    terrain heights of those regions, and those heights are only right
+    height_margin() columns away from the ends of what is generated, so
+    that many more whole regions are generated on both sides and cropped.
+    """
+    region_width = WorldGenerator.region_width
+    reach = WorldGenerator.height_margin()
+
+    first = max(low - WorldGenerator.margin(), 0) // region_width
+    last = (high - 1) // region_width + 1
+    start = max(first * region_width - reach, 0) // region_width *\
+        region_width
+    end = -(-(last * region_width + reach) // region_width) * region_width
+    if world_width is not None:
+        end = min(end, world_width)
+
+    world = ArrayWorldGenerator(end - start, height, seed, start).generate()
+    return bytes(world._tiles[(low - start) * height:(high - start) * height])
+
+
+def generate_parallel(dim, seed=None, workers=None, callback=None):
+    """Generate a world in spans in a pool of workers processes, by default
+    one per CPU"""
+    workers = workers or os.cpu_count() or 1
+    width, height = dim
+    world = World(width, height)
+    world.seed = randrange(2 ** 32) if seed is None else seed
+
+    # every span is generated with a margin on both sides, so keep them
+    # few and large while still giving each worker a couple of them
+    region_width = WorldGenerator.region_width
+    regions = -(-width // region_width)
+    step = max(-(-regions // (workers * 2)), 1) * region_width
+
+    with ProcessPoolExecutor(workers, initializer=WorldObject.init,
+                             initargs=(WorldObject.resource_path,)) as pool:
+        spans = {
+            pool.submit(generate_columns, world.seed, low,
+                        min(low + step, width), height, width): low
+            for low in range(0, width, step)
+        }
+        for span in as_completed(spans):
+            low = spans[span]
+            tiles = span.result()
+            world._tiles[low * height:low * height + len(tiles)] = tiles
+            if callback is not None:
+                callback(world)
+
+    world.update_surfaces()
+    world.schedule_surfaces()
+    world.activate_falling()
+    return world
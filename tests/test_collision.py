@@ -0,0 +1,92 @@
+from os import path
+import random
+import unittest
+
+from src.world import collision
+from src.world.world import WorldObject
+from src.world.world_generator import ArrayWorldGenerator
+
+RESOURCE_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                         'resources')
+
+
+class SweepTest(unittest.TestCase):
+
+    """Sweeping boxes through the column bitmaps ends where moving them a
+    cell at a time and checking every cell would"""
+
+    width = 120
+    height = 80
+    boxes = 3000
+
+    @classmethod
+    def setUpClass(cls):
+        WorldObject.init(RESOURCE_DIR)
+
+    def world(self, seed):
+        # caves and floating blocks, for solid cells on every side
+        world = ArrayWorldGenerator(self.width, self.height, seed).generate()
+        rand = random.Random(seed)
+        for _ in range(self.width * self.height // 8):
+            world.set(rand.randrange(self.width), rand.randrange(self.height),
+                      rand.choice(('air', 'rock')))
+        return world
+
+    def solid(self, world, x, y):
+        return not world.valid(x, y) or world.is_solid(x, y)
+
+    def blocked(self, world, x, y, width, height):
+        return any(self.solid(world, column, row)
+                   for column in range(x, x + width)
+                   for row in range(y, y + height))
+
+    def step(self, world, x, y, width, height, dx, dy):
+        """collision.sweep a cell at a time"""
+        normal_x = normal_y = 0
+        step = 1 if dx > 0 else -1
+        for _ in range(abs(dx)):
+            if self.blocked(world, x + step, y, width, height):
+                normal_x = -step
+                break
+            x += step
+        step = 1 if dy > 0 else -1
+        for _ in range(abs(dy)):
+            if self.blocked(world, x, y + step, width, height):
+                normal_y = -step
+                break
+            y += step
+        return collision.Contact(x, y, (normal_x, normal_y))
+
+    def test_sweep(self):
+        for seed in range(3):
+            world = self.world(seed)
+            rand = random.Random(seed)
+            different = []
+            for _ in range(self.boxes):
+                width, height = rand.randint(1, 3), rand.randint(1, 3)
+                x = rand.randint(-1, self.width - width + 1)
+                y = rand.randrange(self.height - height + 1)
+                if self.blocked(world, x, y, width, height):
+                    continue
+                dx, dy = rand.randint(-8, 8), rand.randint(-8, 8)
+                box = (x, y, width, height, dx, dy)
+                contact = collision.sweep(world, *box)
+                if contact != self.step(world, *box):
+                    different.append(box)
+            self.assertEqual(different, [], 'seed {}'.format(seed))
+
+    def test_blocked(self):
+        world = self.world(0)
+        rand = random.Random(0)
+        different = []
+        for _ in range(self.boxes):
+            width, height = rand.randint(1, 3), rand.randint(1, 3)
+            box = (rand.randint(-2, self.width), rand.randint(-2, self.height),
+                   width, height)
+            if collision.blocked(world, *box) != self.blocked(world, *box):
+                different.append(box)
+        self.assertEqual(different, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+from os import path
+import random
+import unittest
+
+from src.world.world import WorldObject
+from src.world.world_generator import ArrayWorldGenerator
+from src.world.chunked_world import ChunkedWorld
+from src.world.lighting import Lighting
+
+RESOURCE_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                         'resources')
+
+
+class LightingTest(unittest.TestCase):
+
+    """Levels kept up to date through random digging, building and falling
+    sand are the same as computed from scratch for the edited world"""
+
+    width = 160
+    height = 120
+    edits = 300
+
+    @classmethod
+    def setUpClass(cls):
+        WorldObject.init(RESOURCE_DIR)
+
+    def levels(self, lighting):
+        return [bytes(lighting.level(x, y) for y in range(self.height))
+                for x in range(self.width)]
+
+    def edit(self, world, seed):
+        rand = random.Random(seed)
+        for _ in range(self.edits):
+            x = rand.randrange(self.width)
+            y = min(max(world.surface_height(x) + rand.randint(-8, 16), 0),
+                    self.height - 1)
+            action = rand.choice(('dig', 'rock', 'glowstone', 'sand'))
+            if action == 'dig':
+                while world.is_solid(x, y):
+                    world.dig(x, y)
+            elif not world.is_solid(x, y):
+                world.build(x, y, action)
+        while not world.automaton.settled:
+            world.tick(16)
+
+    def check(self, world, seed):
+        # every chunk is computed before the edits, so all of them are
+        # updated incrementally
+        self.levels(world.lighting)
+        self.edit(world, seed)
+        fresh = Lighting(world, WorldObject.transparent_mask,
+                         WorldObject.emission_mask,
+                         world.lighting.chunk_size)
+        expected = self.levels(fresh)
+        different = [(x, y) for x, column in enumerate(
+            self.levels(world.lighting)) for y, level in enumerate(column)
+            if level != expected[x][y]]
+        self.assertEqual(different, [], 'seed {}'.format(seed))
+
+    def test_world(self):
+        for seed in range(4):
+            with self.subTest(seed=seed):
+                world = ArrayWorldGenerator(
+                    self.width, self.height, seed).generate()
+                self.check(world, seed)
+
+    def test_chunked_world(self):
+        for seed in range(2):
+            with self.subTest(seed=seed):
+                world = ChunkedWorld(self.height, seed=seed,
+                                     memory_budget=64 * 2 ** 20)
+                self.check(world, seed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+from os import path
+import random
+import tempfile
+import unittest
+
+from src.world.world import World, WorldObject
+from src.world.world_generator import ArrayWorldGenerator
+from src.world.chunked_world import ChunkedWorld, CHUNK_SIZE, REGION_CHUNKS
+
+RESOURCE_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                         'resources')
+
+
+class WorldFileTest(unittest.TestCase):
+
+    """Worlds saved and loaded again, whole or only their changed chunks,
+    have the same tiles, drops and damage"""
+
+    width = 200
+    height = 96
+    # past two regions, the most the chunked world is given room for
+    chunked_width = 600
+    edits = 400
+
+    @classmethod
+    def setUpClass(cls):
+        WorldObject.init(RESOURCE_DIR)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def load(self, cls, file_path, **kwargs):
+        world = cls.load(file_path, **kwargs)
+        self.addCleanup(world.world_file.close)
+        return world
+
+    def cell(self, world, x, y):
+        return (world.tile(x, y), world._drops.get((x, y)),
+                world._health.get((x, y)))
+
+    def edit(self, world, seed, width=None):
+        """Damage, dig out and build random cells around the surface,
+        returns what the cells held right after"""
+        rand = random.Random(seed)
+        edited = {}
+        for _ in range(self.edits):
+            x = rand.randrange(width or self.width)
+            y = min(max(world.surface_height(x) + rand.randint(-4, 8), 0),
+                    self.height - 1)
+            action = rand.choice(('damage', 'dig', 'build'))
+            if action == 'damage':
+                world.dig(x, y)
+            elif action == 'dig':
+                while world.is_solid(x, y):
+                    world.dig(x, y)
+            elif not world.is_solid(x, y):
+                world.build(x, y, 'rock')
+            edited[(x, y)] = self.cell(world, x, y)
+        return edited
+
+    def state(self, world, width=None):
+        """Tiles, drops and health of every cell column by column"""
+        columns = []
+        for x in range(width or self.width):
+            tiles = world.column_tiles(x)
+            columns.append((tiles, [
+                (world._drops.get((x, y)), world._health.get((x, y)))
+                for y in range(self.height)]))
+        return columns
+
+    def assertKept(self, world, edited):
+        self.assertEqual({cell: self.cell(world, *cell) for cell in edited},
+                         edited)
+
+    def save(self, world, name):
+        file_path = path.join(self.directory, name)
+        world.save(file_path)
+        self.addCleanup(world.world_file.close)
+        return file_path
+
+    def test_world(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                world = ArrayWorldGenerator(
+                    self.width, self.height, seed).generate()
+                edited = self.edit(world, seed)
+                file_path = self.save(world, 'world-{}'.format(seed))
+
+                loaded = self.load(World, file_path)
+                self.assertEqual(loaded.seed, world.seed)
+                self.assertKept(loaded, edited)
+                self.assertEqual(self.state(loaded), self.state(world))
+
+    def test_world_incremental(self):
+        world = ArrayWorldGenerator(self.width, self.height, 0).generate()
+        file_path = self.save(world, 'world')
+        loaded = self.load(World, file_path)
+        edited = {}
+        for seed in range(1, 4):
+            with self.subTest(seed=seed):
+                edited.update(self.edit(loaded, seed))
+                world_file = loaded.world_file
+                loaded.save()
+                # written in place, not to a new file
+                self.assertIs(loaded.world_file, world_file)
+                again = self.load(World, file_path)
+                self.assertKept(again, edited)
+                self.assertEqual(self.state(again), self.state(loaded))
+
+        # saving elsewhere writes every chunk
+        copy_path = self.save(loaded, 'copy')
+        self.assertEqual(self.state(self.load(World, copy_path)),
+                         self.state(loaded))
+
+    def test_chunked_world(self):
+        # room for two regions, so that editing spills chunks
+        budget = 2 * REGION_CHUNKS * -(-self.height // CHUNK_SIZE) *\
+            CHUNK_SIZE * CHUNK_SIZE
+        width = self.chunked_width
+        world = ChunkedWorld(self.height, seed=0, memory_budget=budget)
+        edited = self.edit(world, 0, width)
+        file_path = self.save(world, 'chunked')
+        loaded = self.load(ChunkedWorld, file_path, memory_budget=budget)
+        self.assertKept(loaded, edited)
+        self.assertEqual(self.state(loaded, width), self.state(world, width))
+
+        edited.update(self.edit(loaded, 1, width))
+        loaded.save()
+        again = self.load(ChunkedWorld, file_path, memory_budget=budget)
+        self.assertKept(again, edited)
+        self.assertEqual(self.state(again, width), self.state(loaded, width))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+from os import path
+import unittest
+
+from src.world.world import WorldObject
+from src.world.world_generator import ArrayWorldGenerator, WorldGenerator,\
+    generate_columns, generate_parallel
+from src.world.chunked_world import ChunkedWorld
+
+RESOURCE_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                         'resources')
+
+
+class GenerateColumnsTest(unittest.TestCase):
+
+    """Columns generated on their own, in a process pool or by a chunked
+    world are the same as in the whole world generated in one go"""
+
+    height = 120
+
+    @classmethod
+    def setUpClass(cls):
+        WorldObject.init(RESOURCE_DIR)
+
+    def serial(self, width, seed):
+        world = ArrayWorldGenerator(width, self.height, seed).generate()
+        return bytes(world._tiles)
+
+    def columns(self, tiles, low, high):
+        return tiles[low * self.height:high * self.height]
+
+    def test_generate_columns(self):
+        width = 700
+        for seed in range(30):
+            tiles = self.serial(width, seed)
+            for low in range(0, width, 48):
+                high = min(low + WorldGenerator.region_width, width)
+                with self.subTest(seed=seed, low=low):
+                    self.assertEqual(
+                        generate_columns(seed, low, high, self.height, width),
+                        self.columns(tiles, low, high))
+
+    def test_generate_parallel(self):
+        width = 700
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                world = generate_parallel((width, self.height), seed, 2)
+                self.assertEqual(bytes(world._tiles),
+                                 self.serial(width, seed))
+
+    def test_generate_parallel_default_workers(self):
+        world = generate_parallel((300, self.height), 1)
+        self.assertEqual(bytes(world._tiles), self.serial(300, 1))
+
+    def test_chunked_world(self):
+        # the chunked world has no right edge, columns close enough to the
+        # edge of the serial world to feel it are left out
+        width = 2000
+        region_width = WorldGenerator.region_width
+        high = (width - WorldGenerator.height_margin()) // region_width *\
+            region_width
+        for seed in range(5):
+            tiles = self.serial(width, seed)
+            world = ChunkedWorld(self.height, seed=seed,
+                                 memory_budget=64 * 2 ** 20)
+            different = [x for x in range(high) if world.column_tiles(x) !=
+                         self.columns(tiles, x, x + 1)]
+            self.assertEqual(different, [], 'seed {}'.format(seed))
+
+
+if __name__ == '__main__':
+    unittest.main()